@@ -0,0 +1,47 @@
+"""Throughput comparison: compiled LUT/matrix filters vs the PIL reference path.
+
+Usage: python bench_filters.py [repeats]
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from main import COLOR_FILTERS, apply_filter, apply_filter_pil
+
+RESOLUTIONS = {"720p": (1280, 720), "4K": (3840, 2160)}
+
+def make_test_image(width: int, height: int) -> np.ndarray:
+    """Deterministic photo-like BGR image: smooth gradients plus sensor noise"""
+    rng = np.random.default_rng(42)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.empty((height, width, 3), dtype=np.float32)
+    img[:, :, 0] = 255 * xx / width
+    img[:, :, 1] = 255 * yy / height
+    img[:, :, 2] = 127.5 + 127.5 * np.sin(xx / 97.0) * np.cos(yy / 61.0)
+    img += rng.normal(0, 12, img.shape).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def time_filter(fn, img: np.ndarray, filter_type: str, repeats: int) -> float:
+    fn(img, filter_type)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(img, filter_type)
+    return (time.perf_counter() - start) / repeats * 1000
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{'filter':<16}{'res':<6}{'pil ms':>10}{'lut ms':>10}{'speedup':>9}{'max diff':>10}{'mean diff':>11}")
+    for res_name, (width, height) in RESOLUTIONS.items():
+        img = make_test_image(width, height)
+        for filter_type in COLOR_FILTERS:
+            pil_ms = time_filter(apply_filter_pil, img, filter_type, repeats)
+            lut_ms = time_filter(apply_filter, img, filter_type, repeats)
+            diff = np.abs(apply_filter_pil(img, filter_type).astype(np.int16)
+                          - apply_filter(img, filter_type).astype(np.int16))
+            print(f"{filter_type:<16}{res_name:<6}{pil_ms:>10.2f}{lut_ms:>10.2f}"
+                  f"{pil_ms / lut_ms:>8.1f}x{diff.max():>10d}{diff.mean():>11.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,41 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 import cv2
 import numpy as np
 from PIL import Image, ImageEnhance, ImageFilter
 import io
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import uuid
 import subprocess
 from enum import Enum
 import asyncio
+import bisect
+import fcntl
+import hashlib
+import multiprocessing
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from fractions import Fraction
+from functools import lru_cache
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from gtts import gTTS # type: ignore
 import aiohttp
+import aiofiles
 import json
+import mimetypes
+import urllib.parse
+from email.utils import formatdate, parsedate_to_datetime
 
 app = FastAPI(title="AI Video Studio - Enhanced with Vibrant Animations")
 
@@ -69,6 +90,361 @@ except Exception as e:
 for category in ["upbeat", "calm", "corporate", "cinematic", "inspirational"]:
     (MUSIC_DIR / category).mkdir(parents=True, exist_ok=True)
 
+# Derived-data caches (TTS audio, stock photo hashes, ...) live next to the uploads
+CACHE_DIR = UPLOAD_DIR.parent / "cache"
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# ==================== CACHE HELPERS ====================
+COUNTERS_FILE = CACHE_DIR / "counters.json"
+
+def update_locked_json(path: Path, mutate: Callable[[dict], None]):
+    """Read-modify-write a small JSON document shared by every worker process"""
+    with open(path, 'a+', encoding='utf-8') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0)
+            try:
+                document = json.loads(f.read() or "{}")
+            except json.JSONDecodeError:
+                document = {}
+            mutate(document)
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(document))
+            # Other processes must see the whole document once the lock drops
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_locked_json(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                return json.loads(f.read() or "{}")
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def increment_counter(name: str, amount: int = 1):
+    """Bump a named counter shared by every worker process on this volume"""
+    def bump(counters: dict):
+        counters[name] = counters.get(name, 0) + amount
+    update_locked_json(COUNTERS_FILE, bump)
+
+def read_counters() -> dict:
+    return read_locked_json(COUNTERS_FILE)
+
+def link_or_copy(source: Path, dest: Path):
+    """Hard-link a cached file into place, copying if the volume can't link"""
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+def evict_lru(directory: Path, pattern: str, max_bytes: int, counter: str, companions: tuple = ()):
+    """Delete least-recently-used entries (by mtime) until the directory fits max_bytes
+    
+    Companion files sharing an entry's stem (e.g. its .json metadata) go with it.
+    """
+    entries = []
+    total = 0
+    for path in directory.glob(pattern):
+        if path.name.startswith("."):
+            continue  # in-flight temp files
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+    
+    if total <= max_bytes:
+        return
+    
+    entries.sort()
+    for _, size, path in entries:
+        for suffix in companions:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+        increment_counter(counter)
+        total -= size
+        if total <= max_bytes:
+            break
+
+# ==================== STORAGE STATS ====================
+# File counts, byte totals and the oldest mtime per area are kept in a shared
+# JSON document, adjusted by the code paths that publish or delete long-lived
+# files. A periodic reconciliation scan (the only O(files) work) corrects
+# drift from untracked writes, and is the only thing that advances
+# oldest_mtime after the oldest file is deleted.
+STATS_FILE = CACHE_DIR / "storage_stats.json"
+STATS_LOCK_FILE = CACHE_DIR / "storage_stats.lock"
+STATS_RECONCILE_SECONDS = int(os.getenv("STATS_RECONCILE_SECONDS", "600"))
+STATS_AREAS = ("uploads", "outputs", "music")
+# Render intermediates (temp_*, processed slide JPEGs) and in-flight dotfiles
+# come and go within one render and are never counted
+_UNTRACKED_NAME = re.compile(r"^(\.|temp_)|^[0-9a-f-]{36}\.jpg$")
+
+def stats_area(path: Path) -> Optional[str]:
+    """The stats area a file is counted in, or None for untracked files"""
+    if _UNTRACKED_NAME.match(Path(path).name):
+        return None
+    parent = Path(path).parent
+    if parent == UPLOAD_DIR:
+        return "uploads"
+    if parent == OUTPUT_DIR:
+        return "outputs"
+    if parent.parent == MUSIC_DIR:
+        return "music"
+    return None
+
+def adjust_storage_stats(area: str, files: int, size: int, mtime: Optional[float] = None):
+    """Apply a file count/byte delta to one area"""
+    def apply(stats: dict):
+        entry = stats.setdefault("areas", {}).setdefault(area, {"files": 0, "bytes": 0, "oldest_mtime": None})
+        entry["files"] = max(0, entry["files"] + files)
+        entry["bytes"] = max(0, entry["bytes"] + size)
+        if mtime is not None and entry["oldest_mtime"] is None:
+            entry["oldest_mtime"] = mtime
+        if entry["files"] == 0:
+            entry["oldest_mtime"] = None
+    update_locked_json(STATS_FILE, apply)
+
+def track_files_added(paths: list):
+    """Count newly published files in their areas' stats"""
+    deltas = {}
+    for path in paths:
+        area = stats_area(path)
+        if area is None:
+            continue
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files, size, oldest = deltas.get(area, (0, 0, stat.st_mtime))
+        deltas[area] = (files + 1, size + stat.st_size, min(oldest, stat.st_mtime))
+    for area, (files, size, oldest) in deltas.items():
+        adjust_storage_stats(area, files, size, oldest)
+
+def remove_tracked_files(paths: list) -> int:
+    """Delete files, taking the counted ones out of the stats; returns bytes freed"""
+    deltas = {}
+    freed = 0
+    for path in paths:
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        freed += size
+        area = stats_area(path)
+        if area is not None:
+            files, total = deltas.get(area, (0, 0))
+            deltas[area] = (files + 1, total + size)
+    for area, (files, size) in deltas.items():
+        adjust_storage_stats(area, -files, -size)
+    return freed
+
+def scan_area(area: str) -> dict:
+    directories = [UPLOAD_DIR] if area == "uploads" else [OUTPUT_DIR] if area == "outputs" else \
+        [d for d in MUSIC_DIR.iterdir() if d.is_dir()]
+    files = size = 0
+    oldest = None
+    for directory in directories:
+        with os.scandir(directory) as scanner:
+            for item in scanner:
+                if _UNTRACKED_NAME.match(item.name) or not item.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    stat = item.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                files += 1
+                size += stat.st_size
+                oldest = stat.st_mtime if oldest is None else min(oldest, stat.st_mtime)
+    return {"files": files, "bytes": size, "oldest_mtime": oldest}
+
+def reconcile_storage_stats(force: bool = False) -> Optional[dict]:
+    """Rescan every area and overwrite the incremental stats
+    
+    Returns the new stats, or None if another process holds the scan or a
+    reconciliation ran recently (unless force is set).
+    """
+    with open(STATS_LOCK_FILE, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        previous = read_storage_stats().get("reconciled_at") or 0
+        if not force and time.time() - previous < STATS_RECONCILE_SECONDS / 2:
+            return None
+        started = time.time()
+        areas = {area: scan_area(area) for area in STATS_AREAS}
+        result = {}
+        
+        def replace(stats: dict):
+            drift = {area: areas[area]["files"] - stats.get("areas", {}).get(area, {}).get("files", 0)
+                     for area in STATS_AREAS}
+            stats["areas"] = areas
+            stats["reconciled_at"] = time.time()
+            stats["reconcile_seconds"] = round(time.time() - started, 3)
+            stats["last_drift_files"] = drift
+            result.update(stats)
+        update_locked_json(STATS_FILE, replace)
+        return result
+
+def read_storage_stats() -> dict:
+    return read_locked_json(STATS_FILE)
+
+async def stats_reconcile_loop():
+    while True:
+        try:
+            stats = await asyncio.to_thread(reconcile_storage_stats)
+            if stats and any(stats["last_drift_files"].values()):
+                print(f"📊 Storage stats reconciled (drift: {stats['last_drift_files']})")
+        except Exception as e:
+            print(f"⚠️ Storage stats reconciliation failed: {e}")
+        await asyncio.sleep(STATS_RECONCILE_SECONDS)
+
+_stats_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_stats_reconciliation():
+    global _stats_task
+    if STATS_RECONCILE_SECONDS > 0:
+        _stats_task = asyncio.create_task(stats_reconcile_loop())
+
+@app.on_event("shutdown")
+async def stop_stats_reconciliation():
+    if _stats_task is not None:
+        _stats_task.cancel()
+
+# ==================== METRICS ====================
+# Histograms and gauges live in one shared JSON document (like the counters),
+# so render pool workers and every uvicorn worker feed the same /metrics.
+# Samples are aggregated in memory and merged into the document by a
+# per-process background flusher, so recording one never touches the disk
+# (or blocks the event loop). Gauges are kept per process and summed; a
+# process re-stamps its non-zero gauges on every flush, and entries that were
+# not re-stamped within METRIC_GAUGE_STALE_SECONDS (or whose process died on
+# this host) are ignored and pruned.
+METRICS_FILE = CACHE_DIR / "metrics.json"
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+METRIC_GAUGE_STALE_SECONDS = max(30.0, 6 * METRICS_FLUSH_SECONDS)
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+METRIC_PREFIX = "videogen"
+HOSTNAME = socket.gethostname()
+
+_metrics_lock = threading.Lock()
+_pending_histograms: Dict[str, dict] = {}
+_gauges: Dict[str, int] = {}
+_gauges_dirty = False
+_metrics_flusher: Optional[threading.Thread] = None
+
+def _empty_series() -> dict:
+    return {"buckets": [0] * (len(METRIC_BUCKETS) + 1), "sum": 0.0, "count": 0}
+
+def _start_metrics_flusher():
+    # Caller holds _metrics_lock; one flusher per process (pool workers included)
+    global _metrics_flusher
+    if _metrics_flusher is None:
+        def loop():
+            while True:
+                time.sleep(METRICS_FLUSH_SECONDS)
+                try:
+                    flush_metrics()
+                except Exception as e:
+                    print(f"⚠️ Metrics flush failed: {e}")
+        _metrics_flusher = threading.Thread(target=loop, daemon=True, name="metrics-flush")
+        _metrics_flusher.start()
+
+def observe(name: str, seconds: float, **labels):
+    """Add one sample to a histogram series"""
+    key = json.dumps(labels, sort_keys=True)
+    bucket = bisect.bisect_left(METRIC_BUCKETS, seconds)
+    with _metrics_lock:
+        series = _pending_histograms.setdefault(name, {}).setdefault(key, _empty_series())
+        series["buckets"][bucket] += 1
+        series["sum"] += seconds
+        series["count"] += 1
+        _start_metrics_flusher()
+
+@contextmanager
+def timed(name: str, **labels):
+    """Observe the wall time of a block, whether or not it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def adjust_gauge(name: str, delta: int):
+    """Move this process's share of a gauge"""
+    global _gauges_dirty
+    with _metrics_lock:
+        _gauges[name] = _gauges.get(name, 0) + delta
+        _gauges_dirty = True
+        _start_metrics_flusher()
+
+def flush_metrics():
+    """Merge this process's buffered samples and current gauges into the shared document"""
+    global _pending_histograms, _gauges_dirty
+    with _metrics_lock:
+        histograms, _pending_histograms = _pending_histograms, {}
+        # Non-zero gauges are re-sent every flush as this process's heartbeat
+        gauges = dict(_gauges) if _gauges_dirty or any(_gauges.values()) else None
+        _gauges_dirty = False
+    if not histograms and gauges is None:
+        return
+    owner = f"{HOSTNAME}:{os.getpid()}"
+    now = time.time()
+    
+    def merge(metrics: dict):
+        stored = metrics.setdefault("histograms", {})
+        for name, series in histograms.items():
+            for key, sample in series.items():
+                target = stored.setdefault(name, {}).setdefault(key, _empty_series())
+                target["buckets"] = [a + b for a, b in zip(target["buckets"], sample["buckets"])]
+                target["sum"] += sample["sum"]
+                target["count"] += sample["count"]
+        for name, value in (gauges or {}).items():
+            values = metrics.setdefault("gauges", {}).setdefault(name, {})
+            if value:
+                values[owner] = {"value": value, "seen": now}
+            else:
+                values.pop(owner, None)
+        for values in metrics.get("gauges", {}).values():
+            for stale in [o for o, entry in values.items() if not _gauge_entry_live(o, entry, now)]:
+                del values[stale]
+    update_locked_json(METRICS_FILE, merge)
+
+def _gauge_entry_live(owner: str, entry, now: float) -> bool:
+    """A gauge entry counts while its process keeps re-stamping it (and is alive, on this host)"""
+    if not isinstance(entry, dict) or now - entry.get("seen", 0) > METRIC_GAUGE_STALE_SECONDS:
+        return False
+    return _process_alive(owner)
+
+def _process_alive(owner: str) -> bool:
+    host, _, pid = owner.rpartition(":")
+    if host != HOSTNAME:
+        return True  # other hosts are covered by the heartbeat
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        pass
+    return True
+
+def _metric_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
 # API Keys
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY", "")
 UNSPLASH_ACCESS_KEY = os.getenv("UNSPLASH_ACCESS_KEY", "")
@@ -196,8 +572,8 @@ class FilterType(str, Enum):
     CYBERPUNK = "cyberpunk"
     DREAMY = "dreamy"
 
-def apply_filter(img: np.ndarray, filter_type: str) -> np.ndarray:
-    """Apply various image filters with enhanced visual effects"""
+def apply_filter_pil(img: np.ndarray, filter_type: str) -> np.ndarray:
+    """Apply various image filters with enhanced visual effects (PIL reference path)"""
     if filter_type == "none":
         return img
     
@@ -294,6 +670,94 @@ def apply_filter(img: np.ndarray, filter_type: str) -> np.ndarray:
     
     return cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
 
+# ==================== COMPILED COLOR FILTERS ====================
+# Color-only filters are compiled once at startup into a BGR color matrix
+# and/or per-channel 256-entry LUTs, so they run as one cv2.transform/cv2.LUT
+# pass on the uint8 frame instead of a PIL round-trip. Spatial filters (soft,
+# neon, dreamy) still go through PIL.
+_LUMA_RGB = np.array([0.299, 0.587, 0.114])
+_SEPIA_RGB = np.array([[0.393, 0.769, 0.189],
+                       [0.349, 0.686, 0.168],
+                       [0.272, 0.534, 0.131]])
+
+def _saturation_matrix(factor: float) -> np.ndarray:
+    """RGB matrix equivalent to PIL ImageEnhance.Color(factor)"""
+    return factor * np.eye(3) + (1 - factor) * np.outer(np.ones(3), _LUMA_RGB)
+
+def _rgb_to_bgr_matrix(matrix: np.ndarray) -> np.ndarray:
+    """Reorder an RGB->RGB color matrix to act on BGR pixels"""
+    return np.ascontiguousarray(matrix[::-1, ::-1], dtype=np.float32)
+
+def _channel_lut(blue: float = 1.0, green: float = 1.0, red: float = 1.0) -> np.ndarray:
+    """Per-channel gain LUT shaped for cv2.LUT on BGR images"""
+    x = np.arange(256, dtype=np.float64)
+    channels = [np.clip(x * gain, 0, 255).astype(np.uint8) for gain in (blue, green, red)]
+    return np.stack(channels, axis=-1).reshape(256, 1, 3)
+
+def _tone_lut(mean: int, contrast: float, brightness: float = 1.0) -> np.ndarray:
+    """PIL Contrast (around the image mean) followed by Brightness, as one LUT"""
+    x = np.arange(256, dtype=np.float64)
+    y = np.clip(np.trunc(mean + contrast * (x - mean)), 0, 255)
+    if brightness != 1.0:
+        y = np.clip(np.trunc(y * brightness), 0, 255)
+    return y.astype(np.uint8)
+
+def compile_color_filters() -> dict:
+    """Build the matrix/LUT description of every color-only filter"""
+    def spec(matrix=None, lut=None, contrast=None, brightness=1.0, grayscale=False):
+        return {"matrix": matrix, "lut": lut, "contrast": contrast,
+                "brightness": brightness, "grayscale": grayscale}
+    
+    return {
+        "vintage": spec(matrix=_rgb_to_bgr_matrix(0.5 * _SEPIA_RGB @ _saturation_matrix(0.7))),
+        "warm": spec(lut=_channel_lut(red=1.3, green=1.1)),
+        "cool": spec(lut=_channel_lut(blue=1.3, green=1.05)),
+        "black_and_white": spec(contrast=1.2, grayscale=True),
+        "sepia": spec(matrix=_rgb_to_bgr_matrix(_SEPIA_RGB)),
+        "vibrant": spec(matrix=_rgb_to_bgr_matrix(_saturation_matrix(2.0)), contrast=1.2),
+        "dramatic": spec(contrast=1.8, brightness=0.9),
+        "cyberpunk": spec(lut=_channel_lut(red=1.2, blue=1.4), contrast=1.3),
+    }
+
+COLOR_FILTERS = compile_color_filters()
+
+def apply_color_filter(img: np.ndarray, spec: dict) -> np.ndarray:
+    """Run a compiled color filter on a uint8 BGR image"""
+    out = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if spec["grayscale"] else img
+    if spec["matrix"] is not None:
+        out = cv2.transform(out, spec["matrix"])
+    
+    lut = spec["lut"]
+    if spec["contrast"] is not None:
+        # PIL's Contrast pivots on the mean luma of its input, so the tone
+        # curve is image dependent; estimate the mean on a strided sample.
+        sample = out[::4, ::4]
+        if lut is not None:
+            sample = cv2.LUT(sample, lut)
+        channel_means = cv2.mean(sample)
+        if out.ndim == 2:
+            luma_mean = channel_means[0]
+        else:
+            luma_mean = float(np.dot(_LUMA_RGB[::-1], channel_means[:3]))
+        tone = _tone_lut(int(luma_mean + 0.5), spec["contrast"], spec["brightness"])
+        lut = tone if lut is None else tone[lut]
+    
+    if lut is not None:
+        out = cv2.LUT(out, lut)
+    if spec["grayscale"]:
+        out = cv2.cvtColor(out, cv2.COLOR_GRAY2BGR)
+    return out
+
+def apply_filter(img: np.ndarray, filter_type: str) -> np.ndarray:
+    """Apply various image filters with enhanced visual effects"""
+    if filter_type == "none":
+        return img
+    
+    spec = COLOR_FILTERS.get(filter_type)
+    if spec is not None:
+        return apply_color_filter(img, spec)
+    return apply_filter_pil(img, filter_type)
+
 @app.get("/")
 async def root():
     return {
@@ -322,6 +786,76 @@ async def root():
     }
 
 # ==================== STOCK PHOTOS ====================
+# One keep-alive aiohttp session is shared for the app's lifetime, and search
+# results are kept in an in-memory TTL+LRU cache keyed on the normalized query.
+# Concurrent identical searches share a single upstream request.
+PEXELS_API_URL = os.getenv("PEXELS_API_URL", "https://api.pexels.com/v1")
+STOCK_SEARCH_CACHE_TTL = float(os.getenv("STOCK_SEARCH_CACHE_TTL", "600"))
+STOCK_SEARCH_CACHE_SIZE = int(os.getenv("STOCK_SEARCH_CACHE_SIZE", "512"))
+
+_http_session: Optional[aiohttp.ClientSession] = None
+_search_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_search_inflight = {}
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Shared client session with a pooled keep-alive connector"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=32,
+                                         ttl_dns_cache=300, keepalive_timeout=60)
+        _http_session = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=30))
+    return _http_session
+
+@app.on_event("shutdown")
+async def close_http_session():
+    if _http_session is not None:
+        await _http_session.close()
+
+def _search_cache_get(key: tuple) -> Optional[dict]:
+    entry = _search_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del _search_cache[key]
+        return None
+    _search_cache.move_to_end(key)
+    return value
+
+def _search_cache_put(key: tuple, value: dict):
+    _search_cache[key] = (time.monotonic() + STOCK_SEARCH_CACHE_TTL, value)
+    _search_cache.move_to_end(key)
+    while len(_search_cache) > STOCK_SEARCH_CACHE_SIZE:
+        _search_cache.popitem(last=False)
+
+async def fetch_stock_photos(query: str, page: int, per_page: int) -> dict:
+    """Query Pexels and normalize the response"""
+    headers = {"Authorization": PEXELS_API_KEY}
+    params = {"query": query, "page": page, "per_page": per_page}
+    
+    with timed("upstream_request_seconds", service="pexels", call="search"):
+        return await _fetch_stock_photos(headers, params)
+
+async def _fetch_stock_photos(headers: dict, params: dict) -> dict:
+    async with get_http_session().get(f"{PEXELS_API_URL}/search", headers=headers, params=params) as response:
+        if response.status == 200:
+            data = await response.json()
+            photos = [{
+                "id": p["id"],
+                "photographer": p["photographer"],
+                "thumbnail": p["src"]["medium"],
+                "download_url": p["src"]["original"],
+                "width": p["width"],
+                "height": p["height"],
+                "alt": p.get("alt", "Stock photo")
+            } for p in data.get("photos", [])]
+            return {"photos": photos, "total": data.get("total_results", 0)}
+        else:
+            error_text = await response.text()
+            print(f"❌ Pexels API error: {error_text}")
+            raise HTTPException(response.status, error_text)
+
 @app.get("/api/stock-photos/search")
 async def search_stock_photos(query: str, page: int = 1, per_page: int = 15):
     """Search for stock photos using Pexels API with enhanced responses"""
@@ -330,82 +864,160 @@ async def search_stock_photos(query: str, page: int = 1, per_page: int = 15):
     
     print(f"🔍 Searching stock photos for: {query}")
     
-    url = "https://api.pexels.com/v1/search"
-    headers = {"Authorization": PEXELS_API_KEY}
-    params = {"query": query, "page": page, "per_page": per_page}
+    normalized = " ".join(query.lower().split())
+    key = (normalized, page, per_page)
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    photos = [{
-                        "id": p["id"],
-                        "photographer": p["photographer"],
-                        "thumbnail": p["src"]["medium"],
-                        "download_url": p["src"]["original"],
-                        "width": p["width"],
-                        "height": p["height"],
-                        "alt": p.get("alt", "Stock photo")
-                    } for p in data.get("photos", [])]
-                    
-                    print(f"✅ Found {len(photos)} photos")
-                    return {
-                        "success": True, 
-                        "photos": photos, 
-                        "total": data.get("total_results", 0),
-                        "page": page,
-                        "per_page": per_page
-                    }
-                else:
-                    error_text = await response.text()
-                    print(f"❌ Pexels API error: {error_text}")
-                    raise HTTPException(response.status, error_text)
+        result = _search_cache_get(key)
+        cached = result is not None
+        if not cached:
+            inflight = _search_inflight.get(key)
+            if inflight is None:
+                inflight = asyncio.ensure_future(fetch_stock_photos(normalized, page, per_page))
+                _search_inflight[key] = inflight
+                inflight.add_done_callback(lambda _: _search_inflight.pop(key, None))
+            result = await asyncio.shield(inflight)
+            _search_cache_put(key, result)
+        
+        print(f"✅ Found {len(result['photos'])} photos{' (cached)' if cached else ''}")
+        return {
+            "success": True, 
+            "photos": result["photos"], 
+            "total": result["total"],
+            "page": page,
+            "per_page": per_page,
+            "cached": cached
+        }
     except Exception as e:
         print(f"Stock photo search error: {e}")
         raise HTTPException(500, f"Search failed: {str(e)}")
 
+# Downloads stream to disk in chunks under a size cap and are deduplicated:
+# stock_{photo_id}.jpg is reused if present, and a content-hash index maps
+# identical bytes fetched under another id to the file already stored.
+STOCK_PHOTO_MAX_BYTES = int(os.getenv("STOCK_PHOTO_MAX_MB", "40")) * 1024 * 1024
+STOCK_HASH_DIR = CACHE_DIR / "stock-hashes"
+STOCK_HASH_DIR.mkdir(parents=True, exist_ok=True)
+_stock_inflight = {}
+
+def _stock_filename(photo_id: str, photo_url: str, downscale: bool) -> str:
+    safe_id = re.sub(r'[^A-Za-z0-9_-]', '', photo_id)[:64] or hashlib.sha1(photo_url.encode()).hexdigest()[:16]
+    return f"stock_{safe_id}_720p.jpg" if downscale else f"stock_{safe_id}.jpg"
+
+def downscale_to_working_size(path: Path):
+    """Shrink an image in place so it just covers the render target"""
+    target_w, target_h = TARGET_SIZE
+    img = decode_image_for_target(str(path), target_w, target_h)
+    if img is None:
+        return
+    height, width = img.shape[:2]
+    scale = max(target_w / width, target_h / height)
+    if scale < 1:
+        img = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp.jpg")
+    cv2.imwrite(str(tmp_path), img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    os.replace(tmp_path, path)
+
+async def fetch_stock_photo(photo_url: str, filepath: Path, downscale: bool) -> bool:
+    """Stream a photo to filepath atomically; returns True if the bytes were already stored
+    
+    A duplicate of another photo id is hard-linked to filepath, so later
+    requests for this id hit the filepath.exists() shortcut.
+    """
+    tmp_path = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with timed("upstream_request_seconds", service="pexels", call="download"):
+            async with get_http_session().get(photo_url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                if response.status != 200:
+                    error_msg = f"Failed to download image: HTTP {response.status}"
+                    print(f"❌ {error_msg}")
+                    raise HTTPException(response.status, error_msg)
+                if (response.content_length or 0) > STOCK_PHOTO_MAX_BYTES:
+                    raise HTTPException(413, "Stock photo exceeds the maximum download size")
+                
+                async with aiofiles.open(tmp_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(256 * 1024):
+                        size += len(chunk)
+                        if size > STOCK_PHOTO_MAX_BYTES:
+                            raise HTTPException(413, "Stock photo exceeds the maximum download size")
+                        digest.update(chunk)
+                        await f.write(chunk)
+        
+        if size == 0:
+            raise HTTPException(500, "Downloaded image is empty")
+        
+        # Same bytes already stored under another photo id?
+        hash_entry = STOCK_HASH_DIR / f"{digest.hexdigest()}{'_720p' if downscale else ''}"
+        try:
+            existing_name = hash_entry.read_text().strip()
+            # Only trust a plain file name; a torn or empty entry is ignored
+            if existing_name and Path(existing_name).name == existing_name:
+                existing = UPLOAD_DIR / existing_name
+                if existing.is_file():
+                    link_tmp = filepath.with_name(f".{filepath.name}.{uuid.uuid4().hex}.tmp")
+                    try:
+                        link_or_copy(existing, link_tmp)
+                        os.replace(link_tmp, filepath)
+                    finally:
+                        link_tmp.unlink(missing_ok=True)
+                    track_files_added([filepath])
+                    return True
+            # The file it named was expired or removed
+            hash_entry.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        
+        if downscale:
+            await asyncio.to_thread(downscale_to_working_size, tmp_path)
+        os.replace(tmp_path, filepath)
+        entry_tmp = hash_entry.with_name(f".{hash_entry.name}.{uuid.uuid4().hex}.tmp")
+        entry_tmp.write_text(filepath.name)
+        os.replace(entry_tmp, hash_entry)
+        track_files_added([filepath])
+        return False
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
 @app.post("/api/stock-photos/download")
-async def download_stock_photo(photo_url: str = Form(...), photo_id: str = Form(...)):
+async def download_stock_photo(photo_url: str = Form(...), photo_id: str = Form(...),
+                               downscale: bool = Form(False)):
     """Download a stock photo and save it to the upload directory"""
     try:
         print(f"📥 Downloading stock photo ID: {photo_id}")
         print(f"📍 URL: {photo_url}")
         
-        timeout = aiohttp.ClientTimeout(total=30)
+        filename = _stock_filename(photo_id, photo_url, downscale)
+        filepath = UPLOAD_DIR / filename
+        deduplicated = filepath.exists()
         
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(photo_url) as response:
-                if response.status == 200:
-                    image_data = await response.read()
-                    
-                    if len(image_data) == 0:
-                        raise HTTPException(500, "Downloaded image is empty")
-                    
-                    filename = f"stock_{photo_id}_{uuid.uuid4()}.jpg"
-                    filepath = UPLOAD_DIR / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(image_data)
-                    
-                    if not filepath.exists():
-                        raise HTTPException(500, "Failed to save image file")
-                    
-                    file_size = filepath.stat().st_size
-                    print(f"✅ Stock photo saved: {filename} ({file_size / 1024:.2f} KB)")
-                    
-                    return {
-                        "success": True,
-                        "filename": filename,
-                        "path": str(filepath),
-                        "url": f"/api/download/{filename}",
-                        "size_kb": round(file_size / 1024, 2)
-                    }
-                else:
-                    error_msg = f"Failed to download image: HTTP {response.status}"
-                    print(f"❌ {error_msg}")
-                    raise HTTPException(response.status, error_msg)
+        if not deduplicated:
+            # Concurrent requests for the same photo share one download
+            inflight = _stock_inflight.get(filename)
+            if inflight is None:
+                inflight = asyncio.ensure_future(fetch_stock_photo(photo_url, filepath, downscale))
+                _stock_inflight[filename] = inflight
+                inflight.add_done_callback(lambda _: _stock_inflight.pop(filename, None))
+            deduplicated = await asyncio.shield(inflight)
+        
+        if not filepath.exists():
+            raise HTTPException(500, "Failed to save image file")
+        
+        file_size = filepath.stat().st_size
+        print(f"✅ Stock photo {'reused' if deduplicated else 'saved'}: {filename} ({file_size / 1024:.2f} KB)")
+        
+        return {
+            "success": True,
+            "filename": filename,
+            "path": str(filepath),
+            "url": f"/api/download/{filename}",
+            "size_kb": round(file_size / 1024, 2),
+            "deduplicated": deduplicated
+        }
                     
+    except HTTPException:
+        raise
     except aiohttp.ClientError as e:
         error_msg = f"Network error downloading photo: {str(e)}"
         print(f"❌ {error_msg}")
@@ -502,35 +1114,97 @@ async def get_music_tracks(category: str = "upbeat"):
     tracks = MUSIC_LIBRARY.get(category, [])
     return {"success": True, "category": category, "tracks": tracks}
 
+# id -> track lookup, so requests don't scan every category
+MUSIC_INDEX = {track["id"]: track for tracks in MUSIC_LIBRARY.values() for track in tracks}
+
+# Demo tracks are materialized by a background pool, warmed at startup; each
+# track gets one shared future per process, and a per-track flock on the
+# shared volume makes generation single-flight across uvicorn and render
+# workers. Files are written to a temp name and renamed so nobody ever reads
+# a partial track.
+MUSIC_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="music")
+MUSIC_PRIORITY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="music-priority")
+_music_futures = {}
+_music_futures_lock = threading.Lock()
+
+def materialize_music_track(track: dict) -> Path:
+    """Ensure a track's file exists, generating the demo tone exactly once"""
+    file_path = MUSIC_DIR / track["file"]
+    if file_path.exists():
+        return file_path
+    
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = file_path.parent / f".{file_path.name}.lock"
+    with open(lock_path, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if file_path.exists():
+                return file_path
+            
+            print(f"⚠️ Generating demo audio for: {track['name']}")
+            frequency = 440 + (zlib.crc32(track["id"].encode()) % 200)
+            tmp_path = file_path.parent / f".{file_path.name}.{uuid.uuid4().hex}.tmp"
+            cmd = [
+                'ffmpeg', '-f', 'lavfi', '-i',
+                f'sine=frequency={frequency}:duration={track["duration"]}',
+                '-f', 'mp3', '-y', str(tmp_path)
+            ]
+            result = subprocess.run(cmd, capture_output=True)
+            if result.returncode == 0 and tmp_path.exists():
+                os.replace(tmp_path, file_path)
+                track_files_added([file_path])
+            else:
+                tmp_path.unlink(missing_ok=True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return file_path
+
+def schedule_music_track(track: dict, urgent: bool = False) -> Future:
+    """Future for the track's background materialization, shared by all callers
+    
+    An urgent caller (someone is waiting on the track) moves a still-queued
+    warm-up task to the priority executor instead of waiting behind the backlog.
+    Finished attempts are forgotten, so a failed or since-deleted track is
+    generated again by the next caller.
+    """
+    def forget(done: Future):
+        with _music_futures_lock:
+            if _music_futures.get(track["id"]) is done:
+                del _music_futures[track["id"]]
+    
+    with _music_futures_lock:
+        future = _music_futures.get(track["id"])
+        if future is not None and urgent and future.cancel():
+            future = None
+        if future is None:
+            executor = MUSIC_PRIORITY_EXECUTOR if urgent else MUSIC_EXECUTOR
+            future = executor.submit(materialize_music_track, track)
+            _music_futures[track["id"]] = future
+    future.add_done_callback(forget)
+    return future
+
+@app.on_event("startup")
+async def start_music_warmup():
+    """Queue every missing catalog track for background generation"""
+    missing = [t for t in MUSIC_INDEX.values() if not (MUSIC_DIR / t["file"]).exists()]
+    for track in missing:
+        schedule_music_track(track)
+    if missing:
+        print(f"🎵 Music library warm-up queued {len(missing)} tracks")
+
 @app.get("/api/music/download/{track_id}")
 async def download_music_track(track_id: str):
     """Download a music track (generates demo if needed)"""
-    track_info = None
-    for category, tracks in MUSIC_LIBRARY.items():
-        for track in tracks:
-            if track["id"] == track_id:
-                track_info = track
-                break
-        if track_info:
-            break
+    track_info = MUSIC_INDEX.get(track_id)
     
     if not track_info:
         raise HTTPException(404, f"Track not found: {track_id}")
     
     file_path = MUSIC_DIR / track_info["file"]
     
-    # Generate demo audio if file doesn't exist
+    # Wait for the background materializer rather than generating here
     if not file_path.exists():
-        print(f"⚠️ Generating demo audio for: {track_info['name']}")
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        frequency = 440 + (hash(track_id) % 200)
-        cmd = [
-            'ffmpeg', '-f', 'lavfi', '-i', 
-            f'sine=frequency={frequency}:duration={track_info["duration"]}',
-            '-y', str(file_path)
-        ]
-        subprocess.run(cmd, capture_output=True)
+        await asyncio.wrap_future(schedule_music_track(track_info, urgent=True))
     
     if file_path.exists():
         return FileResponse(
@@ -542,9 +1216,28 @@ async def download_music_track(track_id: str):
     raise HTTPException(500, "Failed to generate track")
 
 # ==================== SUBTITLES ====================
-def generate_subtitles(text: str, duration: float, words_per_subtitle: int = 5):
-    """Generate subtitle segments from text"""
+# burn: drawn into the picture (costs a video encode)
+# soft: mov_text track stream-copied into the mp4 (players can toggle it)
+# sidecar: WebVTT file only, served next to the video
+SUBTITLE_MODES = ("burn", "soft", "sidecar")
+SUBTITLE_FORMATS = ("srt", "vtt")
+mimetypes.add_type("text/vtt", ".vtt")
+
+def check_subtitle_mode(subtitle_mode: str):
+    if subtitle_mode not in SUBTITLE_MODES:
+        raise HTTPException(400, f"Unknown subtitle_mode: {subtitle_mode}. Choose one of: {', '.join(SUBTITLE_MODES)}")
+
+def generate_subtitles(text: str, duration: float, words_per_subtitle: int = 5,
+                       speech_regions: Optional[List[List[float]]] = None):
+    """Generate subtitle segments from text
+    
+    With speech_regions (from narration_speech_regions) cues follow the
+    actual narration and break at its pauses; otherwise words are spread
+    at a uniform rate over the duration.
+    """
     words = text.split()
+    if speech_regions and words:
+        return aligned_subtitles(words, speech_regions, words_per_subtitle)
     subtitles = []
     words_per_second = len(words) / duration if duration > 0 else 1
     
@@ -569,33 +1262,49 @@ def generate_subtitles(text: str, duration: float, words_per_subtitle: int = 5):
     
     return subtitles
 
+def format_subtitle_time(seconds: float, separator: str = ",") -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
 def create_srt_file(subtitles: List[dict], output_path: str):
     """Create SRT subtitle file"""
-    def format_time(seconds):
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-    
     with open(output_path, 'w', encoding='utf-8') as f:
         for sub in subtitles:
             f.write(f"{sub['index']}\n")
-            f.write(f"{format_time(sub['start'])} --> {format_time(sub['end'])}\n")
+            f.write(f"{format_subtitle_time(sub['start'])} --> {format_subtitle_time(sub['end'])}\n")
+            f.write(f"{sub['text']}\n\n")
+
+def create_vtt_file(subtitles: List[dict], output_path: str):
+    """Create WebVTT subtitle file (for HTML5 <track> and HLS players)"""
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\n\n")
+        for sub in subtitles:
+            f.write(f"{sub['index']}\n")
+            f.write(f"{format_subtitle_time(sub['start'], '.')} --> {format_subtitle_time(sub['end'], '.')}\n")
             f.write(f"{sub['text']}\n\n")
 
 @app.post("/api/subtitles/generate")
 async def generate_subtitle_file(
     text: str = Form(...),
     duration: float = Form(...),
-    words_per_subtitle: int = Form(5)
+    words_per_subtitle: int = Form(5),
+    format: str = Form("srt")
 ):
-    """Generate subtitle file from text"""
+    """Generate subtitle file from text (format="srt" or "vtt")"""
+    if format not in SUBTITLE_FORMATS:
+        raise HTTPException(400, f"Unknown subtitle format: {format}. Choose one of: {', '.join(SUBTITLE_FORMATS)}")
     try:
         subtitles = generate_subtitles(text, duration, words_per_subtitle)
-        filename = f"subtitles_{uuid.uuid4()}.srt"
+        filename = f"subtitles_{uuid.uuid4()}.{format}"
         filepath = OUTPUT_DIR / filename
-        create_srt_file(subtitles, str(filepath))
+        if format == "vtt":
+            create_vtt_file(subtitles, str(filepath))
+        else:
+            create_srt_file(subtitles, str(filepath))
+        track_files_added([filepath])
         
         return {
             "success": True,
@@ -607,15 +1316,473 @@ async def generate_subtitle_file(
     except Exception as e:
         raise HTTPException(500, str(e))
 
+# ==================== SUBTITLE ALIGNMENT ====================
+# Narration is decoded once to low-rate mono PCM and split into speech
+# regions by frame energy (vectorized numpy, no silencedetect pass). Words
+# are laid out over the regions in proportion to their length, so captions
+# pause when the voice pauses instead of drifting. Regions are memoized in
+# the TTS cache metadata, so repeat renders skip the decode entirely.
+ALIGN_SAMPLE_RATE = 8000
+ALIGN_FRAME_SECONDS = 0.02
+ALIGN_SILENCE_DB = float(os.getenv("SUBTITLE_SILENCE_DB", "30"))  # below the loud speech level
+ALIGN_FLOOR_DBFS = -60.0
+ALIGN_MIN_PAUSE_SECONDS = 0.25
+ALIGN_MIN_SPEECH_SECONDS = 0.06
+ALIGN_SPEC = (f"{ALIGN_SAMPLE_RATE}:{ALIGN_FRAME_SECONDS}:{ALIGN_SILENCE_DB}:{ALIGN_FLOOR_DBFS}:"
+              f"{ALIGN_MIN_PAUSE_SECONDS}:{ALIGN_MIN_SPEECH_SECONDS}")
+
+def decode_pcm(path, rate: int = ALIGN_SAMPLE_RATE) -> np.ndarray:
+    """Decode any audio file to mono int16 samples at rate"""
+    result = subprocess.run(['ffmpeg', '-v', 'error', '-i', str(path), '-ac', '1', '-ar', str(rate),
+                             '-f', 's16le', 'pipe:1'], capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.int16)
+
+def find_speech_regions(samples: np.ndarray, rate: int = ALIGN_SAMPLE_RATE) -> List[List[float]]:
+    """[[start, end], ...] seconds of speech, with pauses shorter than ALIGN_MIN_PAUSE_SECONDS bridged"""
+    frame = int(rate * ALIGN_FRAME_SECONDS)
+    count = len(samples) // frame
+    if count == 0:
+        return []
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame) / 32768.0
+    level = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+    voiced = level > max(np.percentile(level, 95) - ALIGN_SILENCE_DB, ALIGN_FLOOR_DBFS)
+    
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return []
+    # Gaps between syllables and words are not pauses
+    keep = (starts[1:] - ends[:-1]) * ALIGN_FRAME_SECONDS >= ALIGN_MIN_PAUSE_SECONDS
+    starts = np.concatenate((starts[:1], starts[1:][keep]))
+    ends = np.concatenate((ends[:-1][keep], ends[-1:]))
+    long_enough = (ends - starts) * ALIGN_FRAME_SECONDS >= ALIGN_MIN_SPEECH_SECONDS
+    regions = np.stack((starts[long_enough], ends[long_enough]), axis=1) * ALIGN_FRAME_SECONDS
+    return np.round(regions, 3).tolist()
+
+def narration_speech_regions(audio_path: Path, cache_path: Optional[Path] = None) -> Optional[List[List[float]]]:
+    """Speech regions of a narration mp3, memoized in the metadata of its TTS cache entry"""
+    meta_path = Path(cache_path).with_suffix(".json") if cache_path else None
+    meta = None
+    if meta_path:
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            memo = meta.get("speech_regions") or {}
+            if memo.get("spec") == ALIGN_SPEC:
+                return memo["regions"]
+        except (FileNotFoundError, json.JSONDecodeError):
+            meta = None
+    
+    try:
+        regions = find_speech_regions(decode_pcm(audio_path))
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"⚠️ Could not analyse narration for subtitle timing: {e}")
+        return None
+    
+    if meta is not None:
+        meta["speech_regions"] = {"spec": ALIGN_SPEC, "regions": regions}
+        meta_tmp = TTS_CACHE_DIR / f".{meta_path.stem}.{uuid.uuid4().hex}.tmp"
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, meta_path)
+    return regions
+
+def aligned_subtitles(words: List[str], speech_regions: List[List[float]], words_per_subtitle: int = 5) -> List[dict]:
+    """Cue words over the speech regions, starting a new cue at every pause"""
+    regions = np.asarray(speech_regions, dtype=np.float64)
+    lengths = regions[:, 1] - regions[:, 0]
+    region_end = np.cumsum(lengths)
+    
+    # Each word takes speech time in proportion to its length (plus a space) and
+    # belongs to the region its midpoint falls in, so pauses land between words
+    weights = np.array([len(word) + 1 for word in words], dtype=np.float64)
+    cumulative = np.cumsum(weights)
+    midpoints = (cumulative - weights / 2) / cumulative[-1] * region_end[-1]
+    word_region = np.minimum(np.searchsorted(region_end, midpoints, side='right'), len(regions) - 1)
+    
+    # Spread each region's words over that region
+    region_weight = np.bincount(word_region, weights, minlength=len(regions))
+    before = cumulative - weights - (np.cumsum(region_weight) - region_weight)[word_region]
+    scale = lengths[word_region] / region_weight[word_region]
+    starts = regions[word_region, 0] + before * scale
+    ends = starts + weights * scale
+    
+    subtitles = []
+    first = 0
+    for i in range(1, len(words) + 1):
+        if i == len(words) or i - first == words_per_subtitle or word_region[i] != word_region[i - 1]:
+            subtitles.append({
+                "index": len(subtitles) + 1,
+                "start": round(float(starts[first]), 3),
+                "end": round(float(ends[i - 1]), 3),
+                "text": " ".join(words[first:i])
+            })
+            first = i
+    return subtitles
+
+# ==================== AUDIO DURATION ====================
+# Durations of the formats we produce (gTTS MP3, ffmpeg-written MP3 music,
+# ADTS AAC and MP4/M4A) are read in-process from frame headers, Xing/Info/VBRI
+# tags or the mvhd atom; ffprobe is only spawned for anything else.
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+_ADTS_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050,
+                      16000, 12000, 11025, 8000, 7350]
+
+def _parse_mp3_header(data: bytes, pos: int):
+    """Decode the MPEG audio frame header at pos: (frame_length, samples, sample_rate, version, mono) or None"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (data[pos + 1] >> 3) & 0x03
+    layer_bits = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    
+    version = {3: 1, 2: 2, 0: 2.5}[version_bits]
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    padding = (data[pos + 2] >> 1) & 0x01
+    mono = (data[pos + 3] >> 6) == 3
+    
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, version, mono
+    if layer == 3 and version != 1:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate, version, mono
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate, version, mono
+
+def mp3_duration(data: bytes) -> Optional[float]:
+    """Duration of an MP3 from its Xing/Info or VBRI tag, else by walking every frame"""
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        pos = 10 + ((data[6] & 0x7F) << 21 | (data[7] & 0x7F) << 14 | (data[8] & 0x7F) << 7 | (data[9] & 0x7F))
+    
+    # First frame whose successor is also a valid header (guards against false syncs)
+    while pos < len(data) - 4:
+        header = _parse_mp3_header(data, pos)
+        if header and (pos + header[0] >= len(data) - 4 or _parse_mp3_header(data, pos + header[0])):
+            break
+        pos += 1
+    else:
+        return None
+    
+    frame_length, samples, sample_rate, version, mono = header
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info") and data[xing + 7] & 0x01:
+        frames = int.from_bytes(data[xing + 8:xing + 12], "big")
+        return frames * samples / sample_rate
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = int.from_bytes(data[vbri + 14:vbri + 18], "big")
+        return frames * samples / sample_rate
+    
+    total_samples = 0
+    while True:
+        header = _parse_mp3_header(data, pos)
+        if not header or pos + header[0] > len(data):
+            break
+        total_samples += header[1]
+        pos += header[0]
+    return total_samples / sample_rate if total_samples else None
+
+def adts_duration(data: bytes) -> Optional[float]:
+    """Duration of a raw ADTS AAC stream by walking its frame headers"""
+    pos = 0
+    total_samples = 0
+    sample_rate = None
+    while pos + 7 <= len(data) and data[pos] == 0xFF and (data[pos + 1] & 0xF6) == 0xF0:
+        rate_index = (data[pos + 2] >> 2) & 0x0F
+        if rate_index >= len(_ADTS_SAMPLE_RATES):
+            return None
+        sample_rate = _ADTS_SAMPLE_RATES[rate_index]
+        frame_length = ((data[pos + 3] & 0x03) << 11) | (data[pos + 4] << 3) | (data[pos + 5] >> 5)
+        if frame_length < 7:
+            return None
+        total_samples += ((data[pos + 6] & 0x03) + 1) * 1024
+        pos += frame_length
+    return total_samples / sample_rate if total_samples else None
+
+def mp4_duration(path: Path) -> Optional[float]:
+    """Duration from the moov/mvhd atom of an MP4/M4A file"""
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        while f.tell() + 8 <= end:
+            start = f.tell()
+            size = int.from_bytes(f.read(4), "big")
+            kind = f.read(4)
+            if size == 1:
+                size = int.from_bytes(f.read(8), "big")
+            elif size == 0:
+                size = end - start
+            if size < 8:
+                return None
+            if kind == b"moov":
+                end = start + size  # descend into moov
+                continue
+            if kind == b"mvhd":
+                version = f.read(1)[0]
+                f.read(3)
+                if version == 1:
+                    f.read(16)
+                    timescale = int.from_bytes(f.read(4), "big")
+                    duration = int.from_bytes(f.read(8), "big")
+                else:
+                    f.read(8)
+                    timescale = int.from_bytes(f.read(4), "big")
+                    duration = int.from_bytes(f.read(4), "big")
+                return duration / timescale if timescale else None
+            f.seek(start + size)
+    return None
+
+def read_audio_duration(path: Path) -> Optional[float]:
+    """Parse the duration of MP3, ADTS AAC or MP4 audio without spawning a process"""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    if head[4:8] == b"ftyp":
+        return mp4_duration(path)
+    if head[:3] == b"ID3" or (len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0):
+        data = Path(path).read_bytes()
+        if (head[1] & 0x06) == 0 and head[:3] != b"ID3":
+            return adts_duration(data)
+        return mp3_duration(data)
+    return None
+
+# ==================== TTS CACHE ====================
+# Synthesized speech is content-addressed on (normalized text, lang, tld, slow)
+# and kept on the shared volume with its measured duration. Writes go through
+# a temp file + os.replace so concurrent uvicorn/render workers never see a
+# partial mp3; eviction is LRU on mtime, bounded by TTS_CACHE_MAX_MB.
+TTS_CACHE_DIR = CACHE_DIR / "tts"
+TTS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+def probe_audio_duration(path: Path) -> Optional[float]:
+    """Read an audio file's duration (in-process, ffprobe for unknown formats), or None if it can't be measured"""
+    try:
+        duration = read_audio_duration(path)
+        if duration:
+            return duration
+    except Exception as e:
+        print(f"⚠️ Native duration read failed: {e}")
+    
+    try:
+        probe_cmd = ['ffprobe', '-v', 'error', '-show_entries',
+                     'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
+                     str(path)]
+        with timed("audio_probe_seconds"):
+            result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except Exception as e:
+        print(f"⚠️ Duration detection failed: {e}")
+        return None
+
+def tts_cache_key(text: str, lang: str, tld: str, slow: bool) -> str:
+    normalized = " ".join(text.split())
+    payload = json.dumps([normalized, lang, tld, bool(slow)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def tts_cache_lookup(key: str):
+    """Return (mp3_path, meta) for a cached synthesis, or None on a miss"""
+    mp3_path = TTS_CACHE_DIR / f"{key}.mp3"
+    try:
+        with open(TTS_CACHE_DIR / f"{key}.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if mp3_path.exists():
+            os.utime(mp3_path)
+            return mp3_path, meta
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return None
+
+def tts_cache_store(key: str, tmp_path: Path, meta: dict) -> Path:
+    """Atomically move a finished mp3 into the cache and record its metadata"""
+    mp3_path = TTS_CACHE_DIR / f"{key}.mp3"
+    meta = {**meta, "bytes": tmp_path.stat().st_size, "created_at": time.time()}
+    os.replace(tmp_path, mp3_path)
+    
+    meta_tmp = TTS_CACHE_DIR / f".{key}.{uuid.uuid4().hex}.tmp"
+    with open(meta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, TTS_CACHE_DIR / f"{key}.json")
+    
+    evict_lru(TTS_CACHE_DIR, "*.mp3", TTS_CACHE_MAX_BYTES, "tts_cache_evictions", companions=(".json",))
+    return mp3_path
+
+def synthesize_speech(text: str, voice_config: dict):
+    """Return (mp3_path, duration, cache_hit) for text, synthesizing with gTTS on a miss
+    
+    The returned path lives in the cache; link it elsewhere before use because
+    another worker may evict it.
+    """
+    key = tts_cache_key(text, voice_config['lang'], voice_config['tld'], voice_config['slow'])
+    cached = tts_cache_lookup(key)
+    if cached:
+        increment_counter("tts_cache_hits")
+        print(f"♻️ TTS cache hit: {key[:12]}")
+        return cached[0], cached[1].get("duration"), True
+    
+    increment_counter("tts_cache_misses")
+    tmp_path = TTS_CACHE_DIR / f".{key}.{uuid.uuid4().hex}.tmp"
+    try:
+        tts = gTTS(
+            text=text,
+            lang=voice_config['lang'],
+            tld=voice_config['tld'],
+            slow=voice_config['slow']
+        )
+        with timed("upstream_request_seconds", service="gtts", call="synthesize"):
+            tts.save(str(tmp_path))
+        
+        if not tmp_path.exists() or tmp_path.stat().st_size == 0:
+            raise Exception("Failed to generate audio")
+        
+        duration = probe_audio_duration(tmp_path)
+        mp3_path = tts_cache_store(key, tmp_path, {
+            "duration": duration, "lang": voice_config['lang'],
+            "tld": voice_config['tld'], "slow": voice_config['slow']
+        })
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    
+    return mp3_path, duration, False
+
+# ==================== CHUNKED NARRATION ====================
+# gTTS sends its ~100 character parts to Google one after another, so long
+# scripts are split at sentence boundaries and the chunks synthesized in
+# parallel on a bounded thread pool, then joined with a stream-copy concat.
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "300"))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_EXECUTOR = ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix="tts")
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+
+def split_narration(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Split text at sentence boundaries into chunks of at most max_chars (longer sentences stay whole)"""
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def concat_audio(paths: List[Path], output: Path):
+    """Join same-format mp3 files without re-encoding"""
+    list_file = output.parent / f".{output.name}.{uuid.uuid4().hex}.txt"
+    try:
+        with open(list_file, 'w') as f:
+            for path in paths:
+                f.write(f"file '{path}'\n")
+        cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_file),
+               '-c', 'copy', '-f', 'mp3', '-y', str(output)]
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    finally:
+        list_file.unlink(missing_ok=True)
+
+def synthesize_narration(text: str, voice_config: dict):
+    """Return (mp3_path, duration, cache_hit, chunk_durations) for a possibly long script"""
+    chunks = split_narration(text)
+    if len(chunks) <= 1:
+        path, duration, cache_hit = synthesize_speech(text, voice_config)
+        return path, duration, cache_hit, [duration]
+    
+    key = tts_cache_key(text, voice_config['lang'], voice_config['tld'], voice_config['slow'])
+    cached = tts_cache_lookup(key)
+    if cached:
+        increment_counter("tts_cache_hits")
+        print(f"♻️ TTS cache hit: {key[:12]} ({len(chunks)} chunks)")
+        meta = cached[1]
+        return cached[0], meta.get("duration"), True, meta.get("chunk_durations", [])
+    
+    print(f"🧩 Synthesizing narration in {len(chunks)} chunks ({TTS_CONCURRENCY} at a time)")
+    results = list(TTS_EXECUTOR.map(lambda chunk: synthesize_speech(chunk, voice_config), chunks))
+    chunk_durations = [duration for _, duration, _ in results]
+    
+    # Pin the chunks outside the cache so eviction can't race the concat
+    work_dir = Path(tempfile.mkdtemp(dir=TTS_CACHE_DIR, prefix=".join_"))
+    try:
+        parts = []
+        for idx, (chunk_path, _, _) in enumerate(results):
+            part = work_dir / f"{idx:04d}.mp3"
+            link_or_copy(chunk_path, part)
+            parts.append(part)
+        joined = work_dir / "joined.mp3"
+        concat_audio(parts, joined)
+        
+        if all(d is not None for d in chunk_durations):
+            duration = sum(chunk_durations)
+        else:
+            duration = probe_audio_duration(joined)
+        mp3_path = tts_cache_store(key, joined, {
+            "duration": duration, "chunk_durations": chunk_durations,
+            "lang": voice_config['lang'], "tld": voice_config['tld'], "slow": voice_config['slow']
+        })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return mp3_path, duration, False, chunk_durations
+
+async def stream_narration(text: str, voice_config: dict):
+    """Yield mp3 bytes chunk by chunk, in order, as soon as each chunk is synthesized"""
+    loop = asyncio.get_running_loop()
+    futures = [loop.run_in_executor(TTS_EXECUTOR, synthesize_speech, chunk, voice_config)
+               for chunk in split_narration(text)]
+    try:
+        for future in futures:
+            chunk_path, _, _ = await future
+            async with aiofiles.open(chunk_path, 'rb') as f:
+                yield await f.read()
+    finally:
+        for future in futures:
+            future.cancel()
+
+@app.get("/api/tts/cache")
+async def get_tts_cache_stats():
+    """TTS cache hit/miss counters and current size"""
+    counters = read_counters()
+    hits = counters.get("tts_cache_hits", 0)
+    misses = counters.get("tts_cache_misses", 0)
+    sizes = [p.stat().st_size for p in TTS_CACHE_DIR.glob("*.mp3")]
+    return {
+        "success": True,
+        "hits": hits,
+        "misses": misses,
+        "evictions": counters.get("tts_cache_evictions", 0),
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        "entries": len(sizes),
+        "size_mb": round(sum(sizes) / (1024 * 1024), 2),
+        "max_size_mb": TTS_CACHE_MAX_BYTES // (1024 * 1024)
+    }
+
 # ==================== GOOGLE TTS WITH 24+ VOICES ====================
 @app.post("/api/advanced-tts")
 async def advanced_text_to_speech(
     text: str = Form(...),
     voice: str = Form("en-us-female"),
     rate: str = Form("+0%"),
-    pitch: str = Form("+0Hz")
+    pitch: str = Form("+0Hz"),
+    stream: bool = Form(False)
 ):
-    """Advanced Text-to-Speech with 24+ voice options"""
+    """Advanced Text-to-Speech with 24+ voice options
+    
+    With stream=true the mp3 is streamed back chunk by chunk as synthesis progresses.
+    """
     try:
         print(f"\n🎤 ADVANCED TTS")
         print(f"Text: {text[:50]}...")
@@ -630,29 +1797,24 @@ async def advanced_text_to_speech(
         print(f"Using: {voice_config['name']}")
         print(f"Language: {voice_config['lang']}, TLD: {voice_config['tld']}, Slow: {voice_config['slow']}")
         
-        # Generate audio with gTTS
-        tts = gTTS(
-            text=text, 
-            lang=voice_config['lang'],
-            tld=voice_config['tld'],
-            slow=voice_config['slow']
-        )
-        tts.save(str(output_path))
+        if stream:
+            return StreamingResponse(
+                stream_narration(text, voice_config),
+                media_type="audio/mpeg",
+                headers={"X-Voice-Id": voice, "X-Chunk-Count": str(len(split_narration(text)))}
+            )
+        
+        # Generate audio with gTTS (or reuse a cached synthesis), off the event loop
+        cached_path, duration, cache_hit, chunk_durations = await asyncio.to_thread(
+            synthesize_narration, text, voice_config)
+        link_or_copy(cached_path, output_path)
+        track_files_added([output_path])
         
         # Verify file
         if not output_path.exists() or output_path.stat().st_size == 0:
             raise Exception("Failed to generate audio")
         
-        # Get duration
-        try:
-            probe_cmd = [
-                'ffprobe', '-v', 'error', '-show_entries', 
-                'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-                str(output_path)
-            ]
-            result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-            duration = float(result.stdout.strip())
-        except:
+        if duration is None:
             duration = len(text.split()) / 2.5
         
         print(f"✅ Audio generated: {duration:.2f}s")
@@ -667,6 +1829,9 @@ async def advanced_text_to_speech(
             "voice_color": voice_config.get('color', '#3b82f6'),
             "duration": duration,
             "text_length": len(text),
+            "cached": cache_hit,
+            "chunks": len(chunk_durations),
+            "chunk_durations": chunk_durations,
             "url": f"/api/download/{output_filename}"
         }
         
@@ -732,259 +1897,1571 @@ async def list_available_voices():
         "categories": list(voices_by_category.keys())
     }
 
-# ==================== VIDEO CREATION ====================
-def create_video_with_transitions(image_paths: List[str], duration: float, output: str):
-    """Create video from images with smooth transitions"""
-    list_file = OUTPUT_DIR / f"temp_{uuid.uuid4()}.txt"
-    with open(list_file, 'w') as f:
-        for img in image_paths:
-            f.write(f"file '{img}'\n")
-            f.write(f"duration {duration}\n")
-        f.write(f"file '{image_paths[-1]}'\n")
-    
-    cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_file),
-           '-vf', 'fps=24,format=yuv420p', '-c:v', 'libx264',
-           '-preset', 'medium', '-y', output]
+# ==================== QUALITY TIERS ====================
+# "final" is the export encode; "preview" trades resolution, frame rate and
+# compression for a render that comes back in a fraction of the time. Both
+# tune x264 for still images and use a long GOP, since nearly every frame
+# repeats the one before it (scene cuts still start a new GOP per slide).
+QUALITY_TIERS = {
+    "preview": {"width": 640, "height": 360, "fps": 12, "preset": "ultrafast",
+                "crf": 28, "tune": "stillimage", "gop_seconds": 10},
+    "final": {"width": 1280, "height": 720, "fps": 24, "preset": "medium",
+              "crf": 23, "tune": "stillimage", "gop_seconds": 10},
+}
+DEFAULT_QUALITY = "final"
+
+def get_quality_tier(quality: str) -> dict:
+    """Look up a quality tier, rejecting unknown names"""
+    if quality not in QUALITY_TIERS:
+        raise HTTPException(400, f"Unknown quality: {quality}. Choose one of: {', '.join(QUALITY_TIERS)}")
+    return QUALITY_TIERS[quality]
+
+def video_encoder_args(quality: str = DEFAULT_QUALITY) -> List[str]:
+    """libx264 arguments shared by every encode of a tier"""
+    tier = get_quality_tier(quality)
+    return ['-c:v', 'libx264', '-preset', tier["preset"], '-tune', tier["tune"],
+            '-crf', str(tier["crf"]), '-g', str(tier["fps"] * tier["gop_seconds"]),
+            '-pix_fmt', 'yuv420p']
+
+def encoder_settings(quality: str = DEFAULT_QUALITY) -> dict:
+    """Encoder settings of a tier as reported in create-video responses"""
+    tier = get_quality_tier(quality)
+    return {
+        "quality": quality,
+        "codec": "libx264",
+        "resolution": f"{tier['width']}x{tier['height']}",
+        "fps": tier["fps"],
+        "preset": tier["preset"],
+        "crf": tier["crf"],
+        "tune": tier["tune"],
+        "gop": tier["fps"] * tier["gop_seconds"]
+    }
+
+# ==================== IMAGE INGESTION ====================
+TARGET_SIZE = (QUALITY_TIERS["final"]["width"], QUALITY_TIERS["final"]["height"])
+INGEST_THREADS = int(os.getenv("INGEST_THREADS", str(min(8, os.cpu_count() or 2))))
+
+_REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+def decode_image_for_target(path: str, target_w: int, target_h: int) -> Optional[np.ndarray]:
+    """Decode an image, using libjpeg/libpng reduced decode when the source is much larger than the target"""
+    flags = cv2.IMREAD_COLOR
+    try:
+        # PIL only parses the header here, no pixel data is decoded
+        with Image.open(path) as probe:
+            width, height = probe.size
+        # Compare long/short sides so EXIF-rotated photos are handled too
+        long_side, short_side = max(width, height), min(width, height)
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if long_side // factor >= target_w and short_side // factor >= target_h:
+                flags = reduced_flag
+                break
+    except Exception:
+        pass
+    return cv2.imread(path, flags)
+
+# Processed slides are content-addressed on (source sha256, filter, enhance,
+# target size, format), so re-rendering the same photos with different music
+# or narration skips decode/apply_filter/resize entirely. Bump
+# DERIVATIVE_VERSION whenever the processing pipeline changes output.
+DERIVATIVE_VERSION = 1
+DERIVATIVE_CACHE_DIR = CACHE_DIR / "derivatives"
+DERIVATIVE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def derivative_path(source_hash: str, filter: str, enhance: bool, in_memory: bool,
+                    target_size: Tuple[int, int] = TARGET_SIZE) -> Path:
+    target_w, target_h = target_size
+    spec = f"{DERIVATIVE_VERSION}:{source_hash}:{filter}:{int(enhance)}:{target_w}x{target_h}"
+    key = hashlib.sha256(spec.encode()).hexdigest()
+    return DERIVATIVE_CACHE_DIR / f"{key}{'.npy' if in_memory else '.jpg'}"
+
+def load_derivative(cached: Path, in_memory: bool) -> Union[str, np.ndarray, None]:
+    """Fetch a cached slide (a private JPEG link or the frame), or None if missing"""
+    try:
+        if in_memory:
+            frame = np.load(cached)
+        else:
+            img_path = UPLOAD_DIR / f"{uuid.uuid4()}.jpg"
+            link_or_copy(cached, img_path)
+            frame = str(img_path)
+        os.utime(cached)
+        return frame
+    except (FileNotFoundError, ValueError):
+        return None
+
+def store_derivative(cached: Path, img: np.ndarray, img_path: Optional[Path] = None):
+    """Atomically add a processed slide to the cache"""
+    tmp_path = cached.with_name(f".{cached.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        if img_path is not None:
+            link_or_copy(img_path, tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, img)
+        os.replace(tmp_path, cached)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def process_image(idx: int, source_path: str, source_name: str, filter: str, enhance: bool,
+                  in_memory: bool = False, source_hash: Optional[str] = None,
+                  target_size: Tuple[int, int] = TARGET_SIZE) -> Union[str, np.ndarray, None]:
+    """Decode, filter, enhance and resize one upload; returns the processed path (or frame)"""
+    cached = derivative_path(source_hash or file_sha256(source_path), filter, enhance, in_memory, target_size)
+    slide = load_derivative(cached, in_memory)
+    if slide is not None:
+        increment_counter("derivative_cache_hits")
+        print(f"♻️ Reused processed image {idx + 1}")
+        return slide
+    increment_counter("derivative_cache_misses")
+    
+    target_w, target_h = target_size
+    with timed("image_decode_seconds"):
+        img = decode_image_for_target(source_path, target_w, target_h)
+    
+    if img is None:
+        print(f"⚠️ Skipping invalid image: {source_name}")
+        return None
+    
+    # Apply filter if specified
+    if filter != "none":
+        print(f"🎨 Applying {filter} filter to image {idx + 1}")
+        with timed("image_filter_seconds", filter=filter):
+            img = apply_filter(img, filter)
+    
+    # Enhance if requested
+    if enhance:
+        print(f"✨ Enhancing image {idx + 1}")
+        pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        enhancer = ImageEnhance.Sharpness(pil_img)
+        pil_img = enhancer.enhance(1.2)
+        enhancer = ImageEnhance.Contrast(pil_img)
+        pil_img = enhancer.enhance(1.1)
+        img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
+    
+    img_resized = cv2.resize(img, (target_w, target_h))
+    if in_memory:
+        store_derivative(cached, img_resized)
+        print(f"✅ Processed image {idx + 1} in memory")
+        return img_resized
+    
+    img_filename = f"{uuid.uuid4()}.jpg"
+    img_path = UPLOAD_DIR / img_filename
+    try:
+        cv2.imwrite(str(img_path), img_resized)
+        store_derivative(cached, img_resized, img_path)
+    except BaseException:
+        img_path.unlink(missing_ok=True)
+        raise
+    print(f"✅ Processed image {idx + 1}: {img_filename}")
+    return str(img_path)
+
+def process_images(source_paths: List[str], source_names: List[str], filter: str, enhance: bool,
+                   in_memory: bool = False, source_hashes: Optional[List[str]] = None,
+                   target_size: Tuple[int, int] = TARGET_SIZE,
+                   progress: Optional[Callable[[float], None]] = None,
+                   on_output: Optional[Callable[[str], None]] = None) -> list:
+    """Process uploads concurrently (cv2 releases the GIL), keeping upload order
+    
+    Returns processed JPEG paths, or BGR frames when in_memory is set.
+    progress, if given, receives the number of images finished so far;
+    on_output receives each JPEG path as soon as it is written, so a caller
+    can clean up after a partial failure.
+    """
+    def process(idx: int, path: str, name: str, source_hash: Optional[str]):
+        slide = process_image(idx, path, name, filter, enhance, in_memory, source_hash, target_size)
+        if on_output and isinstance(slide, str):
+            on_output(slide)
+        return slide
+    
+    hashes = source_hashes or [None] * len(source_paths)
+    with ThreadPoolExecutor(max_workers=INGEST_THREADS) as pool:
+        futures = [pool.submit(process, idx, path, name, source_hash)
+                   for idx, (path, name, source_hash) in enumerate(zip(source_paths, source_names, hashes))]
+        if progress:
+            for finished, _ in enumerate(as_completed(futures), 1):
+                progress(finished)
+        slides = [slide for slide in (f.result() for f in futures) if slide is not None]
+    evict_lru(DERIVATIVE_CACHE_DIR, "*.*", DERIVATIVE_CACHE_MAX_BYTES, "derivative_cache_evictions")
+    return slides
+
+def effective_frame_source(frame_source: str, transition: str, render_mode: str) -> str:
+    """Transitions are blended from in-memory frames, so they imply piping;
+    segmented encoding pipes every segment as well"""
+    if transition in TRANSITION_KINDS or render_mode == "segmented":
+        return "pipe"
+    return frame_source
+
+# ==================== TRANSITIONS ====================
+# Transitions are rendered only for the overlap window at the end of each
+# slide; still portions reuse one prebuilt I420 frame. Per-frame parameters
+# (alphas, offsets, radii, affine matrices) and masks are computed once per
+# resolution and frame count, and every frame is blended into a reused buffer.
+TRANSITION_FPS = 24
+TRANSITION_SECONDS = 0.5
+TRANSITION_KINDS = {t.value for t in TransitionType} - {TransitionType.NONE.value}
+
+class TransitionBlender:
+    """Produces the frames of one transition between two equally sized BGR stills"""
+    
+    def __init__(self, kind: str, width: int, height: int, num_frames: int):
+        self.kind = kind
+        self.width = width
+        self.height = height
+        t = np.arange(1, num_frames + 1) / (num_frames + 1)
+        self.alphas = t * t * (3 - 2 * t)  # smoothstep easing
+        self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        
+        if kind in ("slide_left", "slide_right", "wipe"):
+            self.offsets = np.round(self.alphas * width).astype(int)
+        elif kind == "circular":
+            yy, xx = np.ogrid[:height, :width]
+            radius_map = np.sqrt((xx - width / 2) ** 2 + (yy - height / 2) ** 2).astype(np.float32)
+            self.radius_map = radius_map
+            self.radii = self.alphas * float(radius_map.max() + 1)
+        elif kind == "dissolve":
+            self.noise = np.random.default_rng(0).integers(0, 255, (height, width), dtype=np.uint8)
+        elif kind == "zoom":
+            center = (width / 2, height / 2)
+            self.matrices = [cv2.getRotationMatrix2D(center, 0, 1 + 0.3 * alpha) for alpha in self.alphas]
+            self.warped = np.empty_like(self.buffer)
+    
+    def frame(self, a: np.ndarray, b: np.ndarray, k: int) -> np.ndarray:
+        """Blend frame k of the transition from a to b into the shared buffer"""
+        out = self.buffer
+        alpha = float(self.alphas[k])
+        w = self.width
+        
+        if self.kind == "fade":
+            cv2.addWeighted(a, 1 - alpha, b, alpha, 0, dst=out)
+        elif self.kind == "dissolve":
+            mask = cv2.compare(self.noise, int(alpha * 255), cv2.CMP_LT)
+            np.copyto(out, a)
+            cv2.copyTo(b, mask, out)
+        elif self.kind == "circular":
+            mask = cv2.compare(self.radius_map, float(self.radii[k]), cv2.CMP_LT)
+            np.copyto(out, a)
+            cv2.copyTo(b, mask, out)
+        elif self.kind == "wipe":
+            x = self.offsets[k]
+            out[:, :x] = b[:, :x]
+            out[:, x:] = a[:, x:]
+        elif self.kind == "slide_left":
+            x = self.offsets[k]
+            out[:, :w - x] = a[:, x:]
+            out[:, w - x:] = b[:, :x]
+        elif self.kind == "slide_right":
+            x = self.offsets[k]
+            out[:, x:] = a[:, :w - x]
+            out[:, :x] = b[:, w - x:]
+        elif self.kind == "zoom":
+            cv2.warpAffine(a, self.matrices[k], (w, self.height), dst=self.warped,
+                           borderMode=cv2.BORDER_REFLECT)
+            cv2.addWeighted(self.warped, 1 - alpha, b, alpha, 0, dst=out)
+        else:
+            np.copyto(out, b)
+        return out
+
+@lru_cache(maxsize=32)
+def get_transition_blender(kind: str, width: int, height: int, num_frames: int) -> TransitionBlender:
+    return TransitionBlender(kind, width, height, num_frames)
+
+def slide_frame_counts(num_slides: int, duration: float, fps: int = TRANSITION_FPS) -> List[int]:
+    """Frames per slide on a constant-rate timeline, without cumulative rounding drift"""
+    bounds = [round(i * duration * fps) for i in range(num_slides + 1)]
+    return [bounds[i + 1] - bounds[i] for i in range(num_slides)]
+
+def segment_frames(slide: np.ndarray, next_slide: Optional[np.ndarray], count: int,
+                   transition: str, fps: int = TRANSITION_FPS):
+    """Yield the I420 frames of one slide: the held still, then its transition into next_slide"""
+    height, width = slide.shape[:2]
+    still = cv2.cvtColor(slide, cv2.COLOR_BGR2YUV_I420)
+    blend = 0
+    if next_slide is not None and transition in TRANSITION_KINDS:
+        blend = min(round(TRANSITION_SECONDS * fps), count // 2)
+    for _ in range(count - blend):
+        yield still
+    if blend:
+        yuv_buffer = np.empty_like(still)
+        blender = get_transition_blender(transition, width, height, blend)
+        for k in range(blend):
+            cv2.cvtColor(blender.frame(slide, next_slide, k), cv2.COLOR_BGR2YUV_I420, dst=yuv_buffer)
+            yield yuv_buffer
+
+def transition_frames(slides: List[np.ndarray], duration: float, transition: str, fps: int = TRANSITION_FPS):
+    """Yield the constant-rate I420 frame sequence for slides joined by `transition`
+    
+    Each transition overlaps the end of the outgoing slide, so the total
+    length stays len(slides) * duration and audio/subtitle timing is unchanged.
+    """
+    counts = slide_frame_counts(len(slides), duration, fps)
+    for i, count in enumerate(counts):
+        next_slide = slides[i + 1] if i + 1 < len(slides) else None
+        yield from segment_frames(slides[i], next_slide, count, transition, fps)
+
+# ==================== VIDEO CREATION ====================
+# Deliverable mp4s carry the moov atom up front so playback starts before the download ends
+MP4_FASTSTART = ['-movflags', '+faststart']
+# Optional HLS rendition: flat files next to the mp4 (video_x.m3u8, video_x_00001.ts)
+# so /api/download serves the playlist and its segments
+HLS_SEGMENT_SECONDS = 2
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+def hls_segment_pattern(playlist: str) -> str:
+    return f"{playlist[:-len('.m3u8')]}_%05d.ts"
+
+def output_args(output: str, hls_playlist: Optional[str] = None) -> List[str]:
+    """Muxer arguments for the final mp4, teed into a live HLS playlist when requested
     
-    subprocess.run(cmd, capture_output=True, text=True, check=True)
-    list_file.unlink()
+    The event playlist is rewritten after every segment, so players can start
+    on the first slides while the encode is still running. The tee muxer
+    needs explicit -map options from the caller.
+    """
+    if not hls_playlist:
+        return [*MP4_FASTSTART, '-y', output]
+    hls = (f"[f=hls:hls_time={HLS_SEGMENT_SECONDS}:hls_playlist_type=event:"
+           f"hls_flags=independent_segments+temp_file:"
+           f"hls_segment_filename={hls_segment_pattern(hls_playlist)}]{hls_playlist}")
+    return ['-f', 'tee', '-y', f"[f=mp4:movflags=+faststart]{output}|{hls}"]
+
+def write_hls(video: str, hls_playlist: str):
+    """Remux a finished mp4 into a complete HLS playlist without re-encoding"""
+    # MPEG-TS cannot carry a mov_text track; soft subtitles stay in the mp4
+    cmd = ['ffmpeg', '-i', video, '-map', '0:v', '-map', '0:a?', '-c', 'copy',
+           '-f', 'hls', '-hls_time', str(HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+           '-hls_flags', 'independent_segments',
+           '-hls_segment_filename', hls_segment_pattern(hls_playlist), '-y', hls_playlist]
+    run_ffmpeg(cmd)
+
+SUBTITLE_STYLE = "FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BackColour=&H80000000,Outline=2,Shadow=1,MarginV=30"
+
+def write_concat_list(image_paths: List[str], duration: float) -> Path:
+    """Write an ffmpeg concat-demuxer list showing each image for `duration` seconds"""
+    list_file = OUTPUT_DIR / f"temp_{uuid.uuid4()}.txt"
+    with open(list_file, 'w') as f:
+        for img in image_paths:
+            f.write(f"file '{img}'\n")
+            f.write(f"duration {duration}\n")
+        f.write(f"file '{image_paths[-1]}'\n")
+    return list_file
+
+def slide_input(slides: list, duration: float, transition: str = "none", fps: int = TRANSITION_FPS):
+    """ffmpeg input args for the slide sequence
+    
+    Slides are either JPEG paths (read back through a concat list) or BGR
+    frames, which are piped to ffmpeg as rawvideo with one frame per still,
+    or as a full-rate I420 stream when a transition is rendered.
+    Returns (input_args, frames_to_pipe, list_file, video_filter).
+    """
+    if isinstance(slides[0], np.ndarray):
+        height, width = slides[0].shape[:2]
+        if transition in TRANSITION_KINDS and len(slides) > 1:
+            args = ['-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-s', f'{width}x{height}',
+                    '-framerate', str(fps), '-i', 'pipe:0']
+            return args, transition_frames(slides, duration, transition, fps), None, f'fps={fps}'
+        
+        rate = Fraction(duration).limit_denominator(1000)
+        args = ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+                '-framerate', f'{rate.denominator}/{rate.numerator}', '-i', 'pipe:0']
+        # Repeat the last still so it is held for its full duration on every
+        # ffmpeg version, then trim the timeline back to exactly N stills
+        video_filter = f'fps={fps},trim=duration={len(slides) * duration:.3f}'
+        return args, slides + [slides[-1]], None, video_filter
+    
+    list_file = write_concat_list(slides, duration)
+    return ['-f', 'concat', '-safe', '0', '-i', str(list_file)], None, list_file, f'fps={fps}'
+
+def read_ffmpeg_progress(stream, progress: Callable[[float], None]):
+    """Parse `-progress` key=value blocks, reporting the output timestamp in seconds per block"""
+    out_seconds = 0.0
+    for raw in stream:
+        key, _, value = raw.decode(errors='replace').strip().partition('=')
+        if key == 'out_time_us' and value.isdigit():
+            out_seconds = int(value) / 1_000_000
+        elif key == 'progress':
+            progress(out_seconds)
+
+def run_ffmpeg(cmd: List[str], frames: Optional[list] = None, progress: Optional[Callable[[float], None]] = None):
+    """Run ffmpeg, optionally streaming raw frames to its stdin; raises CalledProcessError on failure
+    
+    progress, if given, receives the output timestamp in seconds as ffmpeg
+    reports it through -progress.
+    """
+    adjust_gauge("ffmpeg_processes", 1)
+    try:
+        return _run_ffmpeg(cmd, frames, progress)
+    finally:
+        adjust_gauge("ffmpeg_processes", -1)
+
+def _run_ffmpeg(cmd: List[str], frames: Optional[list], progress: Optional[Callable[[float], None]]):
+    if frames is None and progress is None:
+        return subprocess.run(cmd, capture_output=True, text=True, check=True)
+    
+    if progress is not None:
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(cmd, stderr=stderr_file,
+                                stdin=subprocess.PIPE if frames is not None else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE if progress is not None else subprocess.DEVNULL)
+        reader = None
+        if progress is not None:
+            reader = threading.Thread(target=read_ffmpeg_progress, args=(proc.stdout, progress), daemon=True)
+            reader.start()
+        if frames is not None:
+            try:
+                for frame in frames:
+                    proc.stdin.write(np.ascontiguousarray(frame).data)
+            except BrokenPipeError:
+                pass
+            finally:
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+        returncode = proc.wait()
+        if reader is not None:
+            reader.join()
+        if returncode != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_file.read().decode(errors='replace'))
+    return None
+
+def subtitle_filter(subtitle: str) -> str:
+    """libass subtitles filter expression with the studio caption style"""
+    sub_escaped = subtitle.replace('\\', '/').replace(':', '\\\\:')
+    return f"subtitles='{sub_escaped}':force_style='{SUBTITLE_STYLE}'"
+
+def music_mix_filter(music_volume: float, duration: float) -> str:
+    """Voice (input 1) + faded music (input 2) mix graph"""
+    return (f'[1:a]volume=1.0[voice];[2:a]volume={music_volume},afade=t=out:st={duration-2}:d=2[music];'
+            f'[voice][music]amix=inputs=2:duration=first[audio]')
+
+def create_video_with_transitions(slides: list, duration: float, output: str, transition: str = "none",
+                                  quality: str = DEFAULT_QUALITY, progress: Optional[Callable[[float], None]] = None):
+    """Create video from images with smooth transitions"""
+    fps = get_quality_tier(quality)["fps"]
+    input_args, frames, list_file, video_filter = slide_input(slides, duration, transition, fps)
+    
+    cmd = ['ffmpeg', *input_args,
+           '-vf', f'{video_filter},format=yuv420p', *video_encoder_args(quality), *MP4_FASTSTART, '-y', output]
+    
+    try:
+        run_ffmpeg(cmd, frames, progress)
+    finally:
+        if list_file:
+            list_file.unlink(missing_ok=True)
     return True
 
 def add_audio_to_video(video: str, audio: str, output: str, duration: float, 
-                      music: str = None, music_volume: float = 0.3):
+                      music: str = None, music_volume: float = 0.3,
+                      progress: Optional[Callable[[float], None]] = None):
     """Add audio and optional music to video with smooth mixing"""
     if music and os.path.exists(music):
         cmd = [
             'ffmpeg', '-i', video, '-i', audio, '-i', music,
-            '-filter_complex',
-            f'[1:a]volume=1.0[voice];[2:a]volume={music_volume},afade=t=out:st={duration-2}:d=2[music];[voice][music]amix=inputs=2:duration=first[audio]',
+            '-filter_complex', music_mix_filter(music_volume, duration),
             '-map', '0:v', '-map', '[audio]',
-            '-c:v', 'copy', '-c:a', 'aac', '-y', output
+            '-c:v', 'copy', '-c:a', 'aac', *MP4_FASTSTART, '-y', output
         ]
     else:
         cmd = ['ffmpeg', '-i', video, '-i', audio,
                '-map', '0:v', '-map', '1:a',
-               '-c:v', 'copy', '-c:a', 'aac', '-y', output]
+               '-c:v', 'copy', '-c:a', 'aac', *MP4_FASTSTART, '-y', output]
     
-    subprocess.run(cmd, capture_output=True, text=True, check=True)
+    run_ffmpeg(cmd, progress=progress)
     return True
 
-def burn_subtitles(video: str, subtitle: str, output: str):
+def burn_subtitles(video: str, subtitle: str, output: str, quality: str = DEFAULT_QUALITY,
+                   progress: Optional[Callable[[float], None]] = None):
     """Burn subtitles into video with enhanced styling"""
-    sub_escaped = subtitle.replace('\\', '/').replace(':', '\\\\:')
     cmd = [
         'ffmpeg', '-i', video,
-        '-vf', f"subtitles='{sub_escaped}':force_style='FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,BackColour=&H80000000,Outline=2,Shadow=1,MarginV=30'",
-        '-c:a', 'copy', '-y', output
+        '-vf', subtitle_filter(subtitle), *video_encoder_args(quality),
+        '-c:a', 'copy', *MP4_FASTSTART, '-y', output
     ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return result.returncode == 0
+    try:
+        run_ffmpeg(cmd, progress=progress)
+    except subprocess.CalledProcessError:
+        return False
+    return True
 
-@app.post("/api/create-video")
-async def create_video(
-    images: List[UploadFile] = File(...),
-    audio_text: str = Form(None),
-    voice: str = Form("en-us-female"),
-    duration_per_image: float = Form(3.0),
-    transition: str = Form("fade"),
-    filter: str = Form("none"),
-    enhance: bool = Form(False),
-    music_track: str = Form(None),
-    music_volume: float = Form(0.3),
-    add_subtitles: bool = Form(False)
-):
-    """Create video from images with audio, music, and subtitles - Enhanced version"""
+def mux_soft_subtitles(video: str, subtitle: str, output: str,
+                       progress: Optional[Callable[[float], None]] = None):
+    """Add subtitles as a mov_text track; audio and video are stream-copied"""
+    cmd = [
+        'ffmpeg', '-i', video, '-i', subtitle,
+        '-map', '0:v', '-map', '0:a?', '-map', '1:s',
+        '-c', 'copy', '-c:s', 'mov_text', *MP4_FASTSTART, '-y', output
+    ]
     try:
-        print(f"\n🎬 Creating ENHANCED video with {len(images)} images")
-        print(f"🎤 Voice: {voice}")
-        print(f"🎨 Filter: {filter}")
-        print(f"🎭 Transition: {transition}")
-        print(f"🎵 Music: {music_track if music_track else 'None'}")
-        print(f"📝 Subtitles: {'Enabled' if add_subtitles else 'Disabled'}")
-        
-        # Process images with enhanced filters
-        image_paths = []
-        target_w, target_h = 1280, 720
-        
-        for idx, img_file in enumerate(images):
-            contents = await img_file.read()
-            img_filename = f"{uuid.uuid4()}.jpg"
-            img_path = UPLOAD_DIR / img_filename
-            
-            nparr = np.frombuffer(contents, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                print(f"⚠️ Skipping invalid image: {img_file.filename}")
-                continue
-            
-            # Apply filter if specified
-            if filter != "none":
-                print(f"🎨 Applying {filter} filter to image {idx + 1}")
-                img = apply_filter(img, filter)
-            
-            # Enhance if requested
-            if enhance:
-                print(f"✨ Enhancing image {idx + 1}")
-                pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-                enhancer = ImageEnhance.Sharpness(pil_img)
-                pil_img = enhancer.enhance(1.2)
-                enhancer = ImageEnhance.Contrast(pil_img)
-                pil_img = enhancer.enhance(1.1)
-                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-            
-            img_resized = cv2.resize(img, (target_w, target_h))
-            cv2.imwrite(str(img_path), img_resized)
-            image_paths.append(str(img_path))
-            print(f"✅ Processed image {idx + 1}: {img_filename}")
-        
-        if not image_paths:
-            raise HTTPException(400, "No valid images")
-        
-        video_filename = f"video_{uuid.uuid4()}.mp4"
-        audio_path = None
-        audio_duration = 0
-        subtitle_path = None
-        voice_name = "None"
-        voice_emoji = "🎤"
-        voice_color = "#3b82f6"
-        
-        # Generate audio with selected voice
-        if audio_text and audio_text.strip():
-            print(f"🎤 Generating voiceover with voice: {voice}")
-            audio_filename = f"audio_{uuid.uuid4()}.mp3"
-            audio_path = OUTPUT_DIR / audio_filename
-            
-            # Get voice configuration
-            voice_config = get_voice_config(voice)
-            voice_name = voice_config['name']
-            voice_emoji = voice_config.get('emoji', '🎤')
-            voice_color = voice_config.get('color', '#3b82f6')
-            
-            print(f"📢 Using voice: {voice_name} {voice_emoji}")
-            print(f"🌐 Language: {voice_config['lang']}, TLD: {voice_config['tld']}")
-            
-            # Generate audio with gTTS
-            tts = gTTS(
-                text=audio_text,
-                lang=voice_config['lang'],
-                tld=voice_config['tld'],
-                slow=voice_config['slow']
-            )
-            tts.save(str(audio_path))
-            
-            if audio_path.exists() and audio_path.stat().st_size > 0:
-                # Get duration
-                try:
-                    probe_cmd = ['ffprobe', '-v', 'error', '-show_entries',
-                                'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-                                str(audio_path)]
-                    result = subprocess.run(probe_cmd, capture_output=True, text=True)
-                    audio_duration = float(result.stdout.strip())
-                    duration_per_image = audio_duration / len(image_paths)
-                    print(f"⏱️ Audio duration: {audio_duration:.2f}s ({duration_per_image:.2f}s per image)")
-                except Exception as e:
-                    print(f"⚠️ Duration detection failed: {e}")
-                    audio_duration = len(audio_text.split()) / 2.5
-                    duration_per_image = audio_duration / len(image_paths)
-                
-                # Generate subtitles
-                if add_subtitles:
-                    print("📝 Generating enhanced subtitles...")
-                    subtitles = generate_subtitles(audio_text, audio_duration)
-                    subtitle_filename = f"subtitles_{uuid.uuid4()}.srt"
-                    subtitle_path = OUTPUT_DIR / subtitle_filename
-                    create_srt_file(subtitles, str(subtitle_path))
-                    print(f"✅ Generated {len(subtitles)} subtitle segments")
+        run_ffmpeg(cmd, progress=progress)
+    except subprocess.CalledProcessError:
+        return False
+    return True
+
+def render_single_pass(slides: list, duration: float, output: str, total_duration: float,
+                       audio: str = None, music: str = None, music_volume: float = 0.3,
+                       subtitle: str = None, transition: str = "none", quality: str = DEFAULT_QUALITY,
+                       progress: Optional[Callable[[float], None]] = None, hls_playlist: str = None):
+    """Image sequence, voice/music mix, fade and subtitle burn-in in one ffmpeg encode"""
+    fps = get_quality_tier(quality)["fps"]
+    input_args, frames, list_file, video_filter = slide_input(slides, duration, transition, fps)
+    try:
+        cmd = ['ffmpeg', *input_args]
+        video_chain = f'{video_filter},format=yuv420p'
+        if subtitle:
+            video_chain += f",{subtitle_filter(subtitle)}"
+        graph = [f'[0:v]{video_chain}[video]']
+        maps = ['-map', '[video]']
+        
+        if audio:
+            cmd += ['-i', audio]
+            if music and os.path.exists(music):
+                cmd += ['-i', music]
+                graph.append(music_mix_filter(music_volume, total_duration))
+                maps += ['-map', '[audio]']
+            else:
+                maps += ['-map', '1:a']
+        
+        cmd += ['-filter_complex', ';'.join(graph), *maps, *video_encoder_args(quality)]
+        if hls_playlist:
+            # Keyframes on the HLS grid so the live playlist gets short segments
+            cmd += ['-force_key_frames', f'expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})']
+        if audio:
+            cmd += ['-c:a', 'aac']
+        cmd += output_args(output, hls_playlist)
+        
+        run_ffmpeg(cmd, frames, progress)
+    finally:
+        if list_file:
+            list_file.unlink(missing_ok=True)
+    return True
+
+# ==================== SEGMENTED ENCODING ====================
+# render_mode="segmented" encodes every slide (with its outgoing transition) as
+# an independent H.264 segment using identical encoder settings, several at a
+# time, then joins them with a stream-copy concat. Segments are cached by
+# content, so editing one slide re-encodes only the segments that show it.
+# Up to RENDER_WORKERS renders run at once, so each render's segment encoders
+# get an equal share of the CPUs rather than all of them.
+SEGMENT_VERSION = 2
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+SEGMENT_WORKERS = int(os.getenv("SEGMENT_WORKERS", str(max(1, (os.cpu_count() or 2) // RENDER_WORKERS))))
+SEGMENT_THREADS = max(1, (os.cpu_count() or 2) // (RENDER_WORKERS * SEGMENT_WORKERS))
+SEGMENT_CACHE_DIR = CACHE_DIR / "segments"
+SEGMENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_MB", "1024")) * 1024 * 1024
+
+def segment_encoder_args(quality: str = DEFAULT_QUALITY) -> List[str]:
+    """Tier encoder arguments plus a fixed timescale so segments concat cleanly"""
+    fps = get_quality_tier(quality)["fps"]
+    return [*video_encoder_args(quality), '-video_track_timescale', str(fps * 512)]
+
+def encode_segment(path: Path, slide: np.ndarray, next_slide: Optional[np.ndarray], count: int,
+                   transition: str, subtitle: Optional[str] = None, start: float = 0.0,
+                   quality: str = DEFAULT_QUALITY):
+    """Encode one slide segment into the cache
+    
+    Subtitles are burned per segment by shifting the segment onto the full
+    timeline while the subtitles filter runs.
+    """
+    height, width = slide.shape[:2]
+    fps = get_quality_tier(quality)["fps"]
+    video_filter = 'null'
+    if subtitle:
+        video_filter = f'setpts=PTS+{start:.6f}/TB,{subtitle_filter(subtitle)},setpts=PTS-STARTPTS'
+    tmp_path = SEGMENT_CACHE_DIR / f".{path.stem}.{uuid.uuid4().hex}.mp4"
+    cmd = ['ffmpeg', '-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-s', f'{width}x{height}',
+           '-framerate', str(fps), '-i', 'pipe:0',
+           '-vf', video_filter, '-r', str(fps), *segment_encoder_args(quality), '-threads', str(SEGMENT_THREADS),
+           '-an', '-y', str(tmp_path)]
+    try:
+        run_ffmpeg(cmd, segment_frames(slide, next_slide, count, transition, fps))
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def render_segmented(slides: List[np.ndarray], duration: float, output: str, total_duration: float,
+                     audio: str = None, music: str = None, music_volume: float = 0.3,
+                     subtitle: str = None, transition: str = "none", quality: str = DEFAULT_QUALITY,
+                     progress: Optional[Callable[[float], None]] = None,
+                     mux_progress: Optional[Callable[[float], None]] = None,
+                     hls_playlist: str = None) -> dict:
+    """Encode changed segments in parallel, then concat and mux audio without re-encoding video
+    
+    progress receives the seconds of video encoded so far (reused segments
+    count immediately); mux_progress follows the final concat/mux.
+    """
+    height, width = slides[0].shape[:2]
+    fps = get_quality_tier(quality)["fps"]
+    counts = slide_frame_counts(len(slides), duration, fps)
+    slide_hashes = [hashlib.sha256(np.ascontiguousarray(slide).data).hexdigest() for slide in slides]
+    subtitle_hash = file_sha256(subtitle) if subtitle else None
+    encoder = ' '.join(segment_encoder_args(quality))
+    
+    segment_paths = []
+    pending = []
+    start_frame = 0
+    for i, count in enumerate(counts):
+        has_next = transition in TRANSITION_KINDS and i + 1 < len(slides)
+        next_hash = slide_hashes[i + 1] if has_next else None
+        # Subtitled segments depend on where they sit on the timeline
+        spec = (f"{SEGMENT_VERSION}:{slide_hashes[i]}:{next_hash}:{transition if has_next else 'none'}:"
+                f"{count}:{fps}:{width}x{height}:{subtitle_hash}:"
+                f"{start_frame if subtitle_hash else 0}:{encoder}")
+        path = SEGMENT_CACHE_DIR / f"{hashlib.sha256(spec.encode()).hexdigest()}.mp4"
+        if path.exists():
+            os.utime(path)  # refresh LRU position
+        else:
+            pending.append((path, slides[i], slides[i + 1] if has_next else None, count,
+                            transition, subtitle, start_frame / fps, quality))
+        segment_paths.append(path)
+        start_frame += count
+    
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(SEGMENT_WORKERS, len(pending))) as pool:
+            futures = {pool.submit(encode_segment, *args): args[3] for args in pending}
+            done_frames = start_frame - sum(futures.values())
+            for future in as_completed(futures):
+                future.result()
+                done_frames += futures[future]
+                if progress:
+                    progress(done_frames / fps)
+    elif progress:
+        progress(start_frame / fps)
+    reused = len(segment_paths) - len(pending)
+    increment_counter("segment_cache_hits", reused)
+    increment_counter("segment_cache_misses", len(pending))
+    print(f"🧩 Segments: {len(pending)} encoded, {reused} reused")
+    
+    list_file = OUTPUT_DIR / f"temp_{uuid.uuid4()}.txt"
+    with open(list_file, 'w') as f:
+        for path in segment_paths:
+            f.write(f"file '{path}'\n")
+    try:
+        cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', str(list_file)]
+        maps = ['-map', '0:v']
+        if audio:
+            cmd += ['-i', audio]
+            if music and os.path.exists(music):
+                cmd += ['-i', music, '-filter_complex', music_mix_filter(music_volume, total_duration)]
+                maps += ['-map', '[audio]']
             else:
-                print("❌ Audio generation failed")
-                audio_path = None
+                maps += ['-map', '1:a']
+        cmd += [*maps, '-c:v', 'copy']
+        if audio:
+            cmd += ['-c:a', 'aac']
+        cmd += output_args(output, hls_playlist)
+        run_ffmpeg(cmd, progress=mux_progress)
+    finally:
+        list_file.unlink(missing_ok=True)
+    
+    evict_lru(SEGMENT_CACHE_DIR, "*.mp4", SEGMENT_CACHE_MAX_BYTES, "segment_cache_evictions")
+    return {"total": len(segment_paths), "encoded": len(pending), "reused": reused}
+
+# ==================== RENDER PROGRESS ====================
+# Each render publishes per-stage progress into its job record (throttled),
+# where /api/jobs/{job_id}/events picks it up for any uvicorn worker. Stage
+# weights approximate their share of a typical render's wall time.
+PROGRESS_STAGE_WEIGHTS = {"ingest": 15, "tts": 15, "encode": 55, "mux": 10, "subtitles": 5}
+PROGRESS_WRITE_INTERVAL = float(os.getenv("PROGRESS_WRITE_INTERVAL", "0.5"))
+SSE_HEARTBEAT_SECONDS = 15
+
+class RenderProgress:
+    """Per-stage completion of one render, written to its job record
+    
+    Also clocks the wall time spent in each stage (from its start or first
+    update until it finishes or another stage takes over) for timing() and
+    the render_stage_seconds histogram.
+    """
+    
+    def __init__(self, job_id: Optional[str], stages: List[str]):
+        self.job_id = job_id
+        self.stages = {stage: 0.0 for stage in stages}
+        self.current = None
+        self.started_at = time.time()
+        self.seconds = {}
+        self._clock = None  # (stage, perf_counter at entry)
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+    
+    def _enter(self, stage: Optional[str]):
+        # Caller holds the lock
+        now = time.perf_counter()
+        if self._clock and self._clock[0] != stage:
+            running, since = self._clock
+            self.seconds[running] = self.seconds.get(running, 0.0) + now - since
+            self._clock = None
+        if stage and not self._clock:
+            self._clock = (stage, now)
+    
+    def start(self, stage: str):
+        with self._lock:
+            self.stages.setdefault(stage, 0.0)
+            self.current = stage
+            self._enter(stage)
+        self.publish(force=True)
+    
+    def update(self, stage: str, fraction: float):
+        with self._lock:
+            self.stages[stage] = max(self.stages.get(stage, 0.0), min(1.0, fraction))
+            self.current = stage
+            self._enter(stage)
+        self.publish()
+    
+    def finish(self, stage: str):
+        self.update(stage, 1.0)
+        with self._lock:
+            self._enter(None)
+        self.publish(force=True)
+    
+    def complete(self):
+        with self._lock:
+            for stage in self.stages:
+                self.stages[stage] = 1.0
+            self._enter(None)
+        self.publish(force=True)
+        for stage, seconds in self.timing().items():
+            observe("render_stage_seconds", seconds, stage=stage)
+    
+    def timing(self) -> dict:
+        """Seconds per stage plus the render total"""
+        with self._lock:
+            timing = {stage: round(seconds, 3) for stage, seconds in self.seconds.items()}
+        timing["total"] = round(time.time() - self.started_at, 3)
+        return timing
+    
+    def tracker(self, stage: str, total: float) -> Callable[[float], None]:
+        """Callback mapping done units (seconds of output, images, ...) onto a stage"""
+        return lambda done: self.update(stage, done / total if total > 0 else 0.0)
+    
+    def snapshot(self) -> dict:
+        with self._lock:
+            stages = dict(self.stages)
+            current = self.current
+        weights = {stage: PROGRESS_STAGE_WEIGHTS.get(stage, 10) for stage in stages}
+        percent = 100 * sum(weights[s] * f for s, f in stages.items()) / (sum(weights.values()) or 1)
+        elapsed = time.time() - self.started_at
+        eta = elapsed * (100 - percent) / percent if percent > 0 else None
+        return {
+            "stage": current,
+            "percent": round(percent, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "stages": {stage: round(100 * f, 1) for stage, f in stages.items()}
+        }
+    
+    def publish(self, force: bool = False):
+        if not self.job_id:
+            return
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_write < PROGRESS_WRITE_INTERVAL:
+                return
+            self._last_write = now
+        write_job(self.job_id, progress=self.snapshot())
+
+class RenderScratch:
+    """Files one render creates: intermediates always go, outputs survive only success"""
+    
+    def __init__(self):
+        self.temps: List[Path] = []
+        self.outputs: List[Path] = []
+    
+    def temp(self, path) -> Path:
+        self.temps.append(Path(path))
+        return Path(path)
+    
+    def output(self, path) -> Path:
+        self.outputs.append(Path(path))
+        return Path(path)
+    
+    def discard_outputs(self):
+        for path in self.outputs:
+            path.unlink(missing_ok=True)
+            if path.suffix == ".m3u8":
+                for segment in path.parent.glob(f"{path.stem}_*.ts*"):
+                    segment.unlink(missing_ok=True)
+    
+    def cleanup(self):
+        for path in self.temps:
+            path.unlink(missing_ok=True)
+
+def render_video(source_paths: List[str], source_names: List[str], options: dict,
+                 job_id: Optional[str] = None) -> dict:
+    """Run the full render pipeline for one create-video request (blocking)
+    
+    Intermediates (processed JPEGs, narration, subtitles, temp videos) are
+    removed however the render ends; partial outputs are removed on failure.
+    """
+    scratch = RenderScratch()
+    try:
+        return render_pipeline(source_paths, source_names, options, job_id, scratch)
+    except BaseException:
+        scratch.discard_outputs()
+        raise
+    finally:
+        scratch.cleanup()
+
+def render_pipeline(source_paths: List[str], source_names: List[str], options: dict,
+                    job_id: Optional[str], scratch: RenderScratch) -> dict:
+    """The render steps behind render_video
+    
+    With a job_id, stage progress is published to that job's record.
+    """
+    audio_text = options.get("audio_text")
+    voice = options.get("voice", "en-us-female")
+    duration_per_image = options.get("duration_per_image", 3.0)
+    transition = options.get("transition", "fade")
+    filter = options.get("filter", "none")
+    enhance = options.get("enhance", False)
+    music_track = options.get("music_track")
+    music_volume = options.get("music_volume", 0.3)
+    add_subtitles = options.get("add_subtitles", False)
+    subtitle_mode = options.get("subtitle_mode", "burn")
+    render_mode = options.get("render_mode", "single_pass")
+    frame_source = options.get("frame_source", "jpeg")
+    quality = options.get("quality", DEFAULT_QUALITY)
+    hls = options.get("hls", False)
+    tier = get_quality_tier(quality)
+
+    print(f"\n🎬 Creating ENHANCED video with {len(source_paths)} images")
+    print(f"🎤 Voice: {voice}")
+    print(f"🎨 Filter: {filter}")
+    print(f"🎭 Transition: {transition}")
+    print(f"🎵 Music: {music_track if music_track else 'None'}")
+    print(f"📝 Subtitles: {subtitle_mode if add_subtitles else 'Disabled'}")
+    print(f"📐 Quality: {quality} ({tier['width']}x{tier['height']} @ {tier['fps']}fps, {tier['preset']})")
+    
+    frame_source = effective_frame_source(frame_source, transition, render_mode)
+    
+    has_narration = bool(audio_text and audio_text.strip())
+    stages = ["ingest"] + (["tts"] if has_narration else []) + ["encode"]
+    if render_mode == "segmented" or (render_mode == "multi_step" and has_narration):
+        stages.append("mux")
+    if add_subtitles and has_narration and (subtitle_mode == "soft" or
+                                            (render_mode == "multi_step" and subtitle_mode == "burn")):
+        stages.append("subtitles")
+    progress = RenderProgress(job_id, stages)
+    
+    # Process images with enhanced filters
+    progress.start("ingest")
+    slides = process_images(source_paths, source_names, filter, enhance,
+                            in_memory=frame_source == "pipe",
+                            source_hashes=options.get("source_hashes"),
+                            target_size=(tier["width"], tier["height"]),
+                            progress=progress.tracker("ingest", len(source_paths)),
+                            on_output=scratch.temp)
+    progress.finish("ingest")
+    
+    if not slides:
+        raise HTTPException(400, "No valid images")
+    
+    # Named after the job so async clients know the HLS playlist URL up front
+    video_filename = f"video_{job_id or uuid.uuid4()}.mp4"
+    audio_path = None
+    audio_duration = 0
+    subtitle_path = None
+    vtt_path = None
+    subtitles_aligned = False
+    voice_name = "None"
+    voice_emoji = "🎤"
+    voice_color = "#3b82f6"
+    tts_cached = False
+    chunk_durations = []
+    
+    # Generate audio with selected voice
+    if has_narration:
+        progress.start("tts")
+        print(f"🎤 Generating voiceover with voice: {voice}")
+        audio_filename = f"temp_narration_{uuid.uuid4()}.mp3"
+        audio_path = scratch.temp(OUTPUT_DIR / audio_filename)
+        
+        # Get voice configuration
+        voice_config = get_voice_config(voice)
+        voice_name = voice_config['name']
+        voice_emoji = voice_config.get('emoji', '🎤')
+        voice_color = voice_config.get('color', '#3b82f6')
+        
+        print(f"📢 Using voice: {voice_name} {voice_emoji}")
+        print(f"🌐 Language: {voice_config['lang']}, TLD: {voice_config['tld']}")
         
-        total_duration = len(image_paths) * duration_per_image
+        # Generate audio with gTTS (or reuse a cached synthesis)
+        cached_path, audio_duration, tts_cached, chunk_durations = synthesize_narration(audio_text, voice_config)
+        link_or_copy(cached_path, audio_path)
         
+        if audio_path.exists() and audio_path.stat().st_size > 0:
+            if audio_duration:
+                duration_per_image = audio_duration / len(slides)
+                print(f"⏱️ Audio duration: {audio_duration:.2f}s ({duration_per_image:.2f}s per image)")
+            else:
+                audio_duration = len(audio_text.split()) / 2.5
+                duration_per_image = audio_duration / len(slides)
+            
+            # Generate subtitles
+            if add_subtitles:
+                print("📝 Generating enhanced subtitles...")
+                speech_regions = narration_speech_regions(audio_path, cached_path)
+                subtitles = generate_subtitles(audio_text, audio_duration, speech_regions=speech_regions)
+                subtitles_aligned = bool(speech_regions)
+                subtitle_filename = f"temp_subtitles_{uuid.uuid4()}.srt"
+                subtitle_path = scratch.temp(OUTPUT_DIR / subtitle_filename)
+                create_srt_file(subtitles, str(subtitle_path))
+                vtt_path = scratch.output(OUTPUT_DIR / Path(video_filename).with_suffix(".vtt"))
+                create_vtt_file(subtitles, str(scratch.temp(OUTPUT_DIR / f"temp_{vtt_path.name}")))
+                print(f"✅ Generated {len(subtitles)} subtitle segments "
+                      f"({'aligned to narration' if subtitles_aligned else 'uniform timing'})")
+        else:
+            print("❌ Audio generation failed")
+            audio_path = None
+        progress.finish("tts")
+    
+    total_duration = len(slides) * duration_per_image
+    
+    # Get music
+    music_path = None
+    music_name = None
+    track = MUSIC_INDEX.get(music_track) if music_track else None
+    if track:
+        print(f"🎵 Adding background music: {music_track}")
+        # Blocks on the track's lock if the warm-up is still generating it
+        music_path = materialize_music_track(track)
+        music_name = track["name"]
+        print(f"✅ Music track ready: {track['name']}")
+    
+    final_video_path = scratch.output(OUTPUT_DIR / video_filename)
+    # Downloads are served as immutable, so the mp4 is encoded (and remuxed)
+    # under a temp name and only renamed into place once it is complete
+    encoded_path = scratch.temp(OUTPUT_DIR / f"temp_encoded_{video_filename}")
+    hls_path = scratch.output(final_video_path.with_suffix(".m3u8")) if hls else None
+    has_music = bool(music_path and music_path.exists())
+    burn_subtitle = str(subtitle_path) if subtitle_path and add_subtitles and subtitle_mode == "burn" else None
+    soft_subtitle = str(subtitle_path) if subtitle_path and add_subtitles and subtitle_mode == "soft" else None
+    
+    segments = None
+    progress.start("encode")
+    if render_mode == "segmented":
+        print("🧩 Rendering video as parallel segments...")
+        try:
+            segments = render_segmented(
+                slides,
+                duration_per_image,
+                str(encoded_path),
+                total_duration,
+                str(audio_path) if audio_path and audio_path.exists() else None,
+                str(music_path) if has_music else None,
+                music_volume,
+                burn_subtitle,
+                transition,
+                quality,
+                progress.tracker("encode", total_duration),
+                progress.tracker("mux", total_duration),
+                str(hls_path) if hls_path else None
+            )
+            print("✅ Segmented render complete")
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Segmented render failed, falling back to multi-step: {e.stderr[-500:] if e.stderr else e}")
+            render_mode = "multi_step"
+    elif render_mode == "single_pass":
+        print("🎞️ Rendering video in a single ffmpeg pass...")
+        try:
+            render_single_pass(
+                slides,
+                duration_per_image,
+                str(encoded_path),
+                total_duration,
+                str(audio_path) if audio_path and audio_path.exists() else None,
+                str(music_path) if has_music else None,
+                music_volume,
+                burn_subtitle,
+                transition,
+                quality,
+                progress.tracker("encode", total_duration),
+                str(hls_path) if hls_path else None
+            )
+            print("✅ Single-pass render complete")
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Single-pass render failed, falling back to multi-step: {e.stderr[-500:] if e.stderr else e}")
+            render_mode = "multi_step"
+    
+    if render_mode not in ("single_pass", "segmented"):
+        render_mode = "multi_step"
         # Create video
-        temp_video = OUTPUT_DIR / f"temp_{video_filename}"
+        temp_video = scratch.temp(OUTPUT_DIR / f"temp_{video_filename}")
         print("🎞️ Creating video from images...")
-        create_video_with_transitions(image_paths, duration_per_image, str(temp_video))
+        create_video_with_transitions(slides, duration_per_image, str(temp_video), transition, quality,
+                                      progress.tracker("encode", total_duration))
+        progress.finish("encode")
         print("✅ Video base created successfully")
-        
-        # Get music
-        music_path = None
-        music_name = None
-        if music_track:
-            print(f"🎵 Adding background music: {music_track}")
-            for cat, tracks in MUSIC_LIBRARY.items():
-                for track in tracks:
-                    if track["id"] == music_track:
-                        music_path = MUSIC_DIR / track["file"]
-                        music_name = track["name"]
-                        if not music_path.exists():
-                            music_path.parent.mkdir(parents=True, exist_ok=True)
-                            frequency = 440 + (hash(music_track) % 200)
-                            cmd = ['ffmpeg', '-f', 'lavfi', '-i',
-                                  f'sine=frequency={frequency}:duration={track["duration"]}',
-                                  '-y', str(music_path)]
-                            subprocess.run(cmd, capture_output=True)
-                        print(f"✅ Music track ready: {track['name']}")
-                        break
-        
+    
         # Add audio + music
         if audio_path and audio_path.exists():
-            temp_with_audio = OUTPUT_DIR / f"temp_audio_{video_filename}"
+            temp_with_audio = scratch.temp(OUTPUT_DIR / f"temp_audio_{video_filename}")
             print(f"🔊 Mixing audio: voice ({voice_name}) + music (volume: {music_volume})")
+            progress.start("mux")
             add_audio_to_video(
                 str(temp_video), 
                 str(audio_path), 
                 str(temp_with_audio),
                 total_duration, 
-                str(music_path) if music_path and music_path.exists() else None, 
-                music_volume
+                str(music_path) if has_music else None, 
+                music_volume,
+                progress.tracker("mux", total_duration)
             )
             temp_video.unlink()
             temp_video = temp_with_audio
             print("✅ Audio mixing complete")
-        
+    
         # Add subtitles
-        final_video_path = OUTPUT_DIR / video_filename
-        if subtitle_path and subtitle_path.exists() and add_subtitles:
+        if soft_subtitle:
+            print("📝 Muxing soft subtitle track...")
+            progress.start("subtitles")
+            if mux_soft_subtitles(str(temp_video), soft_subtitle, str(encoded_path),
+                                  progress.tracker("subtitles", total_duration)):
+                temp_video.unlink()
+                print("✅ Subtitle track added")
+            else:
+                print("⚠️ Subtitle muxing failed, using video without subtitles")
+                temp_video.rename(encoded_path)
+        elif burn_subtitle:
             print("📝 Burning subtitles into video...")
-            if burn_subtitles(str(temp_video), str(subtitle_path), str(final_video_path)):
+            progress.start("subtitles")
+            if burn_subtitles(str(temp_video), burn_subtitle, str(encoded_path), quality,
+                              progress.tracker("subtitles", total_duration)):
                 temp_video.unlink()
                 print("✅ Subtitles burned successfully")
             else:
                 print("⚠️ Subtitle burning failed, using video without subtitles")
-                temp_video.rename(final_video_path)
+                temp_video.rename(encoded_path)
         else:
-            temp_video.rename(final_video_path)
+            temp_video.rename(encoded_path)
         
-        file_size = final_video_path.stat().st_size
-        print(f"\n🎉 VIDEO CREATION COMPLETE!")
-        print(f"📊 Final size: {file_size / (1024*1024):.2f} MB")
-        print(f"⏱️ Duration: {total_duration:.2f}s")
+        if hls_path:
+            print("📺 Writing HLS playlist...")
+            write_hls(str(encoded_path), str(hls_path))
+    elif soft_subtitle:
+        # The encode already wrote the mp4 (and HLS); add the track with a stream copy
+        print("📝 Muxing soft subtitle track...")
+        progress.start("subtitles")
+        temp_video = scratch.temp(OUTPUT_DIR / f"temp_subs_{video_filename}")
+        if mux_soft_subtitles(str(encoded_path), soft_subtitle, str(temp_video),
+                              progress.tracker("subtitles", total_duration)):
+            os.replace(temp_video, encoded_path)
+            print("✅ Subtitle track added")
+        else:
+            print("⚠️ Subtitle muxing failed, using video without subtitles")
+    
+    os.replace(encoded_path, final_video_path)
+    if vtt_path:
+        os.replace(OUTPUT_DIR / f"temp_{vtt_path.name}", vtt_path)
+    progress.complete()
+    published = [final_video_path, vtt_path] if vtt_path else [final_video_path]
+    if hls_path:
+        published += [hls_path, *OUTPUT_DIR.glob(f"{hls_path.stem}_*.ts")]
+    track_files_added(published)
+    
+    file_size = final_video_path.stat().st_size
+    print(f"\n🎉 VIDEO CREATION COMPLETE!")
+    print(f"📊 Final size: {file_size / (1024*1024):.2f} MB")
+    print(f"⏱️ Duration: {total_duration:.2f}s")
+    
+    return {
+        "success": True,
+        "video_filename": video_filename,
+        "video_url": f"/api/download/{video_filename}",
+        "num_images": options.get("num_images", len(source_paths)),
+        "has_audio": bool(audio_path),
+        "tts_cached": tts_cached,
+        "narration_chunks": len(chunk_durations),
+        "has_music": has_music,
+        "has_subtitles": add_subtitles and bool(subtitle_path),
+        "subtitle_mode": subtitle_mode if add_subtitles else None,
+        "subtitles_aligned": subtitles_aligned,
+        "subtitles_url": f"/api/download/{vtt_path.name}" if vtt_path else None,
+        "video_duration": f"{total_duration:.2f}s",
+        "duration_per_image": f"{duration_per_image:.2f}s",
+        "file_size_mb": f"{file_size / (1024*1024):.2f}",
+        "voice_used": voice_name,
+        "voice_id": voice,
+        "voice_emoji": voice_emoji,
+        "voice_color": voice_color,
+        "music_used": music_name,
+        "filter_applied": filter,
+        "transition_used": transition,
+        "enhanced": enhance,
+        "render_mode": render_mode,
+        "frame_source": frame_source,
+        "segments": segments,
+        "hls_url": f"/api/download/{hls_path.name}" if hls_path else None,
+        "quality": quality,
+        "encoder": encoder_settings(quality),
+        "timing": progress.timing(),
+        "timestamp": str(uuid.uuid4()),
+        "download_url": f"/api/download/{video_filename}"
+    }
+
+# ==================== RENDER JOBS ====================
+# Renders run in a bounded process pool so cv2, gTTS and ffmpeg never block
+# the event loop. Job records live as JSON files on the shared volume so any
+# uvicorn worker can answer status queries.
+# Pending jobs name the API process that owns them; each API process touches
+# a heartbeat file while it runs. A queued/running job whose owner stopped
+# heartbeating (restart, crash) is stale and gets marked failed, which frees
+# its render-cache fingerprint.
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "32"))
+JOB_DIR = OUTPUT_DIR / "jobs"
+JOB_DIR.mkdir(parents=True, exist_ok=True)
+JOB_HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "60"))
+JOB_WAIT_TIMEOUT_SECONDS = int(os.getenv("JOB_WAIT_TIMEOUT_SECONDS", "1800"))
+JOB_OWNER = f"{HOSTNAME}_{os.getpid()}"
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_pending_renders = 0
+# Queue slots held by accepted batch items that have not been submitted yet
+_reserved_renders = 0
+_render_futures: Dict[str, asyncio.Future] = {}
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Lazily create the shared render process pool"""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        print(f"🏭 Render pool started with {RENDER_WORKERS} workers")
+    return _render_pool
+
+def _job_file(job_id: str) -> Path:
+    return JOB_DIR / f"{job_id}.json"
+
+def read_job(job_id: str) -> Optional[dict]:
+    """Load a job record, or None if the id is unknown"""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    try:
+        with open(_job_file(job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_job(job_id: str, **fields) -> dict:
+    """Merge fields into a job record and write it atomically"""
+    record = read_job(job_id) or {"job_id": job_id}
+    record.update(fields)
+    tmp_path = JOB_DIR / f".{job_id}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f)
+    os.replace(tmp_path, _job_file(job_id))
+    return record
+
+def _owner_file(owner: str) -> Path:
+    return JOB_DIR / f"owner_{owner}.alive"
+
+def touch_job_owner():
+    """Heartbeat for the jobs this API process owns"""
+    _owner_file(JOB_OWNER).touch()
+
+def job_is_stale(job: dict) -> bool:
+    """True for a queued/running job whose owning API process is gone"""
+    if job.get("status") not in ("queued", "running"):
+        return False
+    owner = job.get("owner")
+    if owner == JOB_OWNER:
+        return False
+    try:
+        last_seen = _owner_file(owner).stat().st_mtime if owner else job.get("created_at", 0)
+    except FileNotFoundError:
+        last_seen = 0
+    return time.time() - last_seen > JOB_STALE_SECONDS
+
+def read_live_job(job_id: str) -> Optional[dict]:
+    """read_job, marking stale pending jobs failed on the way"""
+    job = read_job(job_id)
+    if job and job_is_stale(job):
+        print(f"⚠️ Render job {job_id} was abandoned by {job.get('owner') or 'an unknown process'}")
+        job = write_job(job_id, status="failed", finished_at=time.time(),
+                        error="Render abandoned: the server handling it stopped")
+    return job
+
+async def job_heartbeat_loop():
+    while True:
+        try:
+            await asyncio.to_thread(touch_job_owner)
+        except OSError as e:
+            print(f"⚠️ Job heartbeat failed: {e}")
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+
+_heartbeat_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_job_heartbeat():
+    global _heartbeat_task
+    _heartbeat_task = asyncio.create_task(job_heartbeat_loop())
+
+@app.on_event("shutdown")
+async def stop_job_heartbeat():
+    if _heartbeat_task is not None:
+        _heartbeat_task.cancel()
+    _owner_file(JOB_OWNER).unlink(missing_ok=True)
+
+def run_render_job(job_id: str, source_paths: List[str], source_names: List[str], options: dict) -> dict:
+    """Process pool entry point: render one job and record its outcome"""
+    write_job(job_id, status="running", started_at=time.time())
+    try:
+        result = render_video(source_paths, source_names, options, job_id)
+        result["job_id"] = job_id
+        write_job(job_id, status="done", finished_at=time.time(), result=result)
+        increment_counter("renders_completed")
+        return result
+    except Exception as e:
+        import traceback
+        print(f"\n❌ ERROR during video creation:")
+        print(f"Error: {str(e)}")
+        print(traceback.format_exc())
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        write_job(job_id, status="failed", finished_at=time.time(), error=detail)
+        increment_counter("renders_failed")
+        raise
+    finally:
+        remove_tracked_files(source_paths)
+        flush_metrics()
+
+def submit_render_job(job_id: str, source_paths: List[str], source_names: List[str], options: dict) -> asyncio.Future:
+    """Queue a render on the process pool, enforcing the queue limit
+
+    The caller writes the "queued" job record first so the render cache can
+    point at the job before it reaches a worker.
+    """
+    global _pending_renders, _render_pool
+    if _pending_renders + _reserved_renders >= RENDER_QUEUE_LIMIT:
+        raise HTTPException(503, "Render queue is full, please retry shortly")
+    
+    loop = asyncio.get_running_loop()
+    try:
+        future = loop.run_in_executor(get_render_pool(), run_render_job,
+                                      job_id, source_paths, source_names, options)
+    except BrokenProcessPool:
+        _render_pool = None
+        future = loop.run_in_executor(get_render_pool(), run_render_job,
+                                      job_id, source_paths, source_names, options)
+    _pending_renders += 1
+    adjust_gauge("render_queue_depth", 1)
+    _render_futures[job_id] = future
+    
+    def on_done(fut: asyncio.Future):
+        global _pending_renders, _render_pool
+        _pending_renders -= 1
+        adjust_gauge("render_queue_depth", -1)
+        _render_futures.pop(job_id, None)
+        if fut.cancelled():
+            return
+        error = fut.exception()
+        if isinstance(error, BrokenProcessPool):
+            # The worker died before it could record the failure itself
+            _render_pool = None
+            asyncio.ensure_future(asyncio.to_thread(write_job, job_id, status="failed", finished_at=time.time(),
+                                                    error="Render worker crashed"))
+    
+    future.add_done_callback(on_done)
+    return future
+
+@app.on_event("shutdown")
+async def shutdown_render_pool():
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+
+# ==================== RENDER CACHE ====================
+# Identical create-video requests (double clicks, re-runs of a project) map to
+# the same fingerprint. The index holds one small file per fingerprint naming
+# the job that owns it; a finished job with its video still on disk, or a job
+# that is still queued/running, is reused instead of encoding again.
+RENDER_CACHE_VERSION = 2
+RENDER_INDEX_DIR = CACHE_DIR / "renders"
+RENDER_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+RENDER_SPEC_FIELDS = ("audio_text", "voice", "duration_per_image", "transition", "filter",
+                      "enhance", "music_track", "music_volume", "add_subtitles",
+                      "subtitle_mode", "render_mode", "frame_source", "quality", "hls")
+
+def render_fingerprint(source_hashes: List[str], options: dict) -> str:
+    """Deterministic key for the full render specification"""
+    spec = {field: options.get(field) for field in RENDER_SPEC_FIELDS}
+    spec["audio_text"] = (spec["audio_text"] or "").strip()
+    spec["images"] = source_hashes
+    spec["version"] = RENDER_CACHE_VERSION
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+def _render_index_file(fingerprint: str) -> Path:
+    return RENDER_INDEX_DIR / f"{fingerprint}.json"
+
+def render_job_reusable(job: Optional[dict]) -> bool:
+    """True while a job is pending, or done with its video still on disk"""
+    if not job:
+        return False
+    status = job.get("status")
+    if status in ("queued", "running"):
+        return True
+    if status == "done":
+        return (OUTPUT_DIR / job["result"]["video_filename"]).exists()
+    return False
+
+def claim_render(fingerprint: str, job_id: str) -> Optional[str]:
+    """Register job_id as the owner of a fingerprint
+    
+    Returns None when the claim succeeded, or the id of the live job that
+    already owns the fingerprint. Stale entries (failed jobs, deleted videos)
+    are replaced; every pass either links the index file, finds a live owner
+    or removes the stale entry, so the loop ends.
+    """
+    index_file = _render_index_file(fingerprint)
+    tmp_path = RENDER_INDEX_DIR / f".{fingerprint}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"job_id": job_id, "created_at": time.time()}, f)
+    try:
+        while True:
+            try:
+                # link() publishes the complete file and fails if one exists
+                os.link(tmp_path, index_file)
+                return None
+            except FileExistsError:
+                pass
+            try:
+                with open(index_file, 'r', encoding='utf-8') as f:
+                    owner = json.load(f)["job_id"]
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                owner = None
+            if owner and render_job_reusable(read_live_job(owner)):
+                return owner
+            release_render(fingerprint, owner)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def release_render(fingerprint: str, job_id: Optional[str]):
+    """Drop a fingerprint's index entry if job_id still owns it"""
+    index_file = _render_index_file(fingerprint)
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            owner = json.load(f).get("job_id")
+    except FileNotFoundError:
+        return
+    except json.JSONDecodeError:
+        owner = None
+    if owner == job_id:
+        index_file.unlink(missing_ok=True)
+
+def open_render_job(fingerprint: str, num_images: int, **fields) -> Tuple[str, Optional[str]]:
+    """Write a queued job record and claim its fingerprint (blocking file I/O)
+    
+    Returns (job_id, owner): owner is None when the new job owns the render,
+    otherwise the id of the live job to reuse (the new record is dropped).
+    """
+    job_id = str(uuid.uuid4())
+    touch_job_owner()
+    write_job(job_id, status="queued", created_at=time.time(), owner=JOB_OWNER,
+              num_images=num_images, fingerprint=fingerprint, **fields)
+    owner = claim_render(fingerprint, job_id)
+    if owner:
+        _job_file(job_id).unlink(missing_ok=True)
+        increment_counter("render_cache_hits")
+    else:
+        increment_counter("render_cache_misses")
+    return job_id, owner
+
+def abandon_render_job(fingerprint: str, job_id: str, error: Exception, source_paths: List[str]):
+    """Record a job that never reached the pool as failed and free its claim (blocking file I/O)"""
+    release_render(fingerprint, job_id)
+    detail = error.detail if isinstance(error, HTTPException) else str(error)
+    write_job(job_id, status="failed", finished_at=time.time(), error=detail)
+    remove_tracked_files(source_paths)
+
+async def wait_for_job(job_id: str, timeout: float = JOB_WAIT_TIMEOUT_SECONDS) -> dict:
+    """Wait for a render owned by any worker process and return its result
+    
+    Gives up with a 504 after timeout seconds; the job itself keeps running.
+    """
+    deadline = time.monotonic() + timeout
+    future = _render_futures.get(job_id)
+    if future is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except Exception:
+            pass  # the job record carries the failure
+    while True:
+        job = await asyncio.to_thread(read_live_job, job_id) or {}
+        status = job.get("status")
+        if status == "done":
+            return job["result"]
+        if status != "queued" and status != "running":
+            raise HTTPException(500, f"Video creation failed: {job.get('error', 'job record missing')}")
+        if time.monotonic() >= deadline:
+            raise HTTPException(504, f"Render {job_id} is still {status}; poll /api/jobs/{job_id}")
+        await asyncio.sleep(0.5)
+
+def response_timing(result: dict, include_timing: bool) -> dict:
+    if not include_timing:
+        result.pop("timing", None)
+    return result
+
+async def stage_uploads(images: List[UploadFile]) -> Tuple[List[str], List[str], List[str]]:
+    """Stage uploads on the shared volume for the render workers
+    
+    Returns (paths, names, sha256 hashes); the hashes feed the render cache.
+    """
+    source_paths = []
+    source_names = []
+    source_hashes = []
+    for img_file in images:
+        contents = await img_file.read()
+        suffix = Path(img_file.filename or "").suffix.lower() or ".img"
+        source_path = UPLOAD_DIR / f"src_{uuid.uuid4()}{suffix}"
+        async with aiofiles.open(source_path, 'wb') as f:
+            await f.write(contents)
+        source_hashes.append((await asyncio.to_thread(hashlib.sha256, contents)).hexdigest())
+        source_paths.append(str(source_path))
+        source_names.append(img_file.filename)
+    await asyncio.to_thread(track_files_added, source_paths)
+    return source_paths, source_names, source_hashes
+
+@app.post("/api/create-video")
+async def create_video(
+    images: List[UploadFile] = File(...),
+    audio_text: str = Form(None),
+    voice: str = Form("en-us-female"),
+    duration_per_image: float = Form(3.0),
+    transition: str = Form("fade"),
+    filter: str = Form("none"),
+    enhance: bool = Form(False),
+    music_track: str = Form(None),
+    music_volume: float = Form(0.3),
+    add_subtitles: bool = Form(False),
+    subtitle_mode: str = Form("burn"),
+    async_job: bool = Form(False),
+    render_mode: str = Form("single_pass"),
+    frame_source: str = Form("jpeg"),
+    quality: str = Form(DEFAULT_QUALITY),
+    hls: bool = Form(False),
+    include_timing: bool = Form(False)
+):
+    """Create video from images with audio, music, and subtitles - Enhanced version
+    
+    With async_job=true the render is queued and a job id is returned right away;
+    poll /api/jobs/{job_id} (or follow /api/jobs/{job_id}/events) and fetch
+    /api/jobs/{job_id}/result when done.
+    render_mode="multi_step" selects the legacy encode/mux/burn-in sequence;
+    render_mode="segmented" encodes per-slide segments in parallel and reuses
+    unchanged ones from the segment cache.
+    frame_source="pipe" streams processed frames to ffmpeg instead of writing JPEGs.
+    A request identical to a finished or in-flight render reuses that render
+    (render_cached=true) instead of encoding again.
+    quality="preview" renders a fast low-resolution draft; "final" is the export.
+    hls=true also writes an HLS playlist (hls_url); in single_pass mode it is
+    updated while encoding, so playback can start before the render finishes.
+    subtitle_mode="soft" adds a toggleable subtitle track instead of burning
+    captions in, and "sidecar" only writes the WebVTT file (subtitles_url),
+    which every mode also provides; neither costs an extra video encode.
+    include_timing=true keeps the per-stage timing breakdown (seconds) in the
+    response; job results always carry it.
+    """
+    get_quality_tier(quality)
+    check_subtitle_mode(subtitle_mode)
+    try:
+        source_paths, source_names, source_hashes = await stage_uploads(images)
         
-        return {
-            "success": True,
-            "video_filename": video_filename,
-            "video_url": f"/api/download/{video_filename}",
+        options = {
+            "audio_text": audio_text,
+            "voice": voice,
+            "duration_per_image": duration_per_image,
+            "transition": transition,
+            "filter": filter,
+            "enhance": enhance,
+            "music_track": music_track,
+            "music_volume": music_volume,
+            "add_subtitles": add_subtitles,
+            "subtitle_mode": subtitle_mode,
+            "render_mode": render_mode,
+            "frame_source": frame_source,
+            "quality": quality,
+            "hls": hls,
             "num_images": len(images),
-            "has_audio": bool(audio_path),
-            "has_music": bool(music_path and music_path.exists()),
-            "has_subtitles": add_subtitles and bool(subtitle_path),
-            "video_duration": f"{total_duration:.2f}s",
-            "duration_per_image": f"{duration_per_image:.2f}s",
-            "file_size_mb": f"{file_size / (1024*1024):.2f}",
-            "voice_used": voice_name,
-            "voice_id": voice,
-            "voice_emoji": voice_emoji,
-            "voice_color": voice_color,
-            "music_used": music_name,
-            "filter_applied": filter,
-            "transition_used": transition,
-            "enhanced": enhance,
-            "timestamp": str(uuid.uuid4()),
-            "download_url": f"/api/download/{video_filename}"
+            "source_hashes": source_hashes
         }
         
+        fingerprint = render_fingerprint(source_hashes, options)
+        job_id, owner = await asyncio.to_thread(open_render_job, fingerprint, len(source_paths))
+        
+        while owner:
+            # Identical render already finished or in flight - reuse it
+            print(f"♻️ Render cache hit: reusing job {owner}")
+            if async_job:
+                await asyncio.to_thread(remove_tracked_files, source_paths)
+                owner_job = await asyncio.to_thread(read_job, owner)
+                return {
+                    "success": True,
+                    "job_id": owner,
+                    "status": (owner_job or {}).get("status"),
+                    "status_url": f"/api/jobs/{owner}",
+                    "events_url": f"/api/jobs/{owner}/events",
+                    "result_url": f"/api/jobs/{owner}/result",
+                    "hls_url": f"/api/download/video_{owner}.m3u8" if hls else None,
+                    "render_cached": True
+                }
+            # Keep our own sources until the shared render succeeds: if it
+            # fails or its server dies, this request renders them itself
+            try:
+                result = await wait_for_job(owner)
+            except HTTPException as e:
+                if e.status_code != 500:
+                    await asyncio.to_thread(remove_tracked_files, source_paths)
+                    raise
+                print(f"⚠️ Shared render {owner} failed ({e.detail}), taking it over")
+                job_id, owner = await asyncio.to_thread(open_render_job, fingerprint, len(source_paths))
+                continue
+            except BaseException:
+                await asyncio.to_thread(remove_tracked_files, source_paths)
+                raise
+            await asyncio.to_thread(remove_tracked_files, source_paths)
+            return response_timing({**result, "render_cached": True}, include_timing)
+        
+        try:
+            future = submit_render_job(job_id, source_paths, source_names, options)
+        except Exception as e:
+            await asyncio.to_thread(abandon_render_job, fingerprint, job_id, e, source_paths)
+            raise
+        
+        if async_job:
+            print(f"📋 Queued render job {job_id} ({len(images)} images)")
+            return {
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/jobs/{job_id}",
+                "events_url": f"/api/jobs/{job_id}/events",
+                "result_url": f"/api/jobs/{job_id}/result",
+                "hls_url": f"/api/download/video_{job_id}.m3u8" if hls else None,
+                "render_cached": False
+            }
+        
+        return response_timing({**await future, "render_cached": False}, include_timing)
+        
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         print(f"\n❌ ERROR during video creation:")
@@ -992,40 +3469,803 @@ async def create_video(
         print(traceback.format_exc())
         raise HTTPException(500, f"Video creation failed: {str(e)}")
 
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Report the status of a queued render job"""
+    job = await asyncio.to_thread(read_live_job, job_id)
+    if not job:
+        raise HTTPException(404, f"Job not found: {job_id}")
+    
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": job.get("status"),
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+        "progress": job.get("progress"),
+        "events_url": f"/api/jobs/{job_id}/events",
+        "result_url": f"/api/jobs/{job_id}/result"
+    }
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events feed of a job's progress, ending with a done/failed event
+    
+    Comment heartbeats keep idle connections alive through proxies.
+    """
+    if not read_job(job_id):
+        raise HTTPException(404, f"Job not found: {job_id}")
+    
+    async def events():
+        last_sent = None
+        last_write = time.monotonic()
+        while True:
+            job = await asyncio.to_thread(read_live_job, job_id) or {}
+            status = job.get("status")
+            payload = {"job_id": job_id, "status": status, "progress": job.get("progress")}
+            if payload != last_sent:
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+                last_sent = payload
+                last_write = time.monotonic()
+            if status == "done":
+                yield f"event: done\ndata: {json.dumps({'job_id': job_id, 'result_url': f'/api/jobs/{job_id}/result'})}\n\n"
+                return
+            if status not in ("queued", "running"):
+                yield f"event: failed\ndata: {json.dumps({'job_id': job_id, 'error': job.get('error', 'job record missing')})}\n\n"
+                return
+            if time.monotonic() - last_write >= SSE_HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+            await asyncio.sleep(PROGRESS_WRITE_INTERVAL)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Return the create-video response for a finished job"""
+    job = await asyncio.to_thread(read_live_job, job_id)
+    if not job:
+        raise HTTPException(404, f"Job not found: {job_id}")
+    
+    status = job.get("status")
+    if status == "done":
+        return job["result"]
+    if status == "failed":
+        raise HTTPException(500, f"Video creation failed: {job.get('error')}")
+    
+    return JSONResponse(
+        status_code=202,
+        content={"success": False, "job_id": job_id, "status": status}
+    )
+
+# ==================== BATCH RENDER ====================
+# Templated bulk renders (same photos with many narrations, one script in many
+# voices) are planned together: every distinct image derivative, narration
+# and music track is produced once by a single prepare step on the render
+# pool, so the renders that follow hit the derivative, TTS and music caches.
+# Identical items collapse onto one job through the render cache. A batch
+# reserves a render queue slot per item when it is accepted (the prepare step
+# runs inside that reservation) and hands each slot to its render on submit.
+# Batch records live next to the job records.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", str(RENDER_QUEUE_LIMIT)))
+BATCH_ITEM_DEFAULTS = {
+    "audio_text": None, "voice": "en-us-female", "duration_per_image": 3.0, "transition": "fade",
+    "filter": "none", "enhance": False, "music_track": None, "music_volume": 0.3,
+    "add_subtitles": False, "subtitle_mode": "burn", "render_mode": "single_pass",
+    "frame_source": "jpeg", "quality": DEFAULT_QUALITY, "hls": False
+}
+BATCH_ITEM_CHOICES = {
+    "voice": tuple(VOICE_CONFIG),
+    "transition": tuple(t.value for t in TransitionType),
+    "filter": tuple(f.value for f in FilterType),
+    "subtitle_mode": SUBTITLE_MODES,
+    "render_mode": ("single_pass", "multi_step", "segmented"),
+    "frame_source": ("jpeg", "pipe"),
+    "quality": tuple(QUALITY_TIERS)
+}
+BATCH_ITEM_RANGES = {"duration_per_image": (0.1, 60.0), "music_volume": (0.0, 1.0)}
+_batch_tasks: Dict[str, asyncio.Task] = {}
+
+def reserve_renders(count: int):
+    global _reserved_renders
+    if _pending_renders + _reserved_renders + count > RENDER_QUEUE_LIMIT:
+        raise HTTPException(503, "Render queue is full, please retry shortly")
+    _reserved_renders += count
+
+def release_renders(count: int):
+    global _reserved_renders
+    _reserved_renders -= count
+
+def batch_item_options(index: int, spec: dict, num_uploads: int) -> Tuple[dict, List[int]]:
+    """Validate one batch spec; returns (render options, indices of the uploads it uses)"""
+    if not isinstance(spec, dict):
+        raise HTTPException(400, f"Batch item {index}: expected an object")
+    unknown = set(spec) - set(BATCH_ITEM_DEFAULTS) - {"images"}
+    if unknown:
+        raise HTTPException(400, f"Batch item {index}: unknown fields {', '.join(sorted(unknown))}")
+    options = {**BATCH_ITEM_DEFAULTS, **{k: v for k, v in spec.items() if k != "images"}}
+    for field in ("audio_text", "music_track"):
+        if options[field] is not None and not isinstance(options[field], str):
+            raise HTTPException(400, f"Batch item {index}: {field} must be a string")
+    for field, choices in BATCH_ITEM_CHOICES.items():
+        if options[field] not in choices:
+            raise HTTPException(400, f"Batch item {index}: {field} must be one of {', '.join(choices)}")
+    for field, (low, high) in BATCH_ITEM_RANGES.items():
+        value = options[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+            raise HTTPException(400, f"Batch item {index}: {field} must be a number from {low} to {high}")
+        options[field] = float(value)
+    for flag in ("enhance", "add_subtitles", "hls"):
+        if not isinstance(options[flag], bool):
+            raise HTTPException(400, f"Batch item {index}: {flag} must be true or false")
+    
+    indices = spec.get("images", list(range(num_uploads)))
+    if (not isinstance(indices, list) or not indices
+            or not all(isinstance(i, int) and 0 <= i < num_uploads for i in indices)):
+        raise HTTPException(400, f"Batch item {index}: images must list upload indices 0-{num_uploads - 1}")
+    return options, indices
+
+def plan_batch(items: List[Tuple[dict, List[int]]], source_paths: List[str], source_names: List[str],
+               source_hashes: List[str]) -> dict:
+    """Distinct shared work across the batch (plain data, so it can cross to a pool worker)"""
+    images = {}
+    narrations = {}
+    music = set()
+    for options, indices in items:
+        in_memory = effective_frame_source(options["frame_source"], options["transition"],
+                                           options["render_mode"]) == "pipe"
+        tier = get_quality_tier(options["quality"])
+        for i in indices:
+            key = (source_hashes[i], options["filter"], options["enhance"], in_memory, tier["width"], tier["height"])
+            images.setdefault(key, (source_paths[i], source_names[i]))
+        text = (options["audio_text"] or "").strip()
+        if text:
+            key = (text, options["voice"])
+            narrations[key] = narrations.get(key, False) or options["add_subtitles"]
+        if options["music_track"] in MUSIC_INDEX:
+            music.add(options["music_track"])
+    return {
+        "images": [[path, name, *key] for key, (path, name) in images.items()],
+        "narrations": [[text, voice, subtitles] for (text, voice), subtitles in narrations.items()],
+        "music": sorted(music)
+    }
+
+def prepare_batch_assets(plan: dict) -> dict:
+    """Process pool entry point: produce the batch's shared inputs once; returns per-stage seconds
+    
+    Failures are only logged - the affected renders redo the work and report
+    the error themselves.
+    """
+    timing = {}
+    
+    started = time.perf_counter()
+    def derive(idx: int, image: list):
+        path, name, source_hash, filter, enhance, in_memory, width, height = image
+        slide = process_image(idx, path, name, filter, enhance, in_memory, source_hash, (width, height))
+        if isinstance(slide, str):
+            os.unlink(slide)  # only the cached derivative is needed
+    with ThreadPoolExecutor(max_workers=INGEST_THREADS) as pool:
+        for future in [pool.submit(derive, idx, image) for idx, image in enumerate(plan["images"])]:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ Batch image preparation failed: {e}")
+    evict_lru(DERIVATIVE_CACHE_DIR, "*.*", DERIVATIVE_CACHE_MAX_BYTES, "derivative_cache_evictions")
+    timing["images"] = round(time.perf_counter() - started, 3)
+    
+    started = time.perf_counter()
+    def narrate(text: str, voice: str, subtitles: bool):
+        path = synthesize_narration(text, get_voice_config(voice))[0]
+        if subtitles:
+            narration_speech_regions(path, path)
+    # Separate from TTS_EXECUTOR, which synthesize_narration uses for chunks
+    with ThreadPoolExecutor(max_workers=TTS_CONCURRENCY) as pool:
+        for future in [pool.submit(narrate, *narration) for narration in plan["narrations"]]:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ Batch narration failed: {e}")
+    timing["tts"] = round(time.perf_counter() - started, 3)
+    
+    started = time.perf_counter()
+    for track_id in plan["music"]:
+        try:
+            materialize_music_track(MUSIC_INDEX[track_id])
+        except Exception as e:
+            print(f"⚠️ Batch music preparation failed: {e}")
+    timing["music"] = round(time.perf_counter() - started, 3)
+    return timing
+
+def stage_batch_item(source_paths: List[str], indices: List[int], item_paths: List[str]):
+    """Give one batch render its own copies of the staged sources (blocking file I/O)"""
+    try:
+        for i, item_path in zip(indices, item_paths):
+            link_or_copy(Path(source_paths[i]), Path(item_path))
+    except BaseException:
+        for item_path in item_paths:
+            Path(item_path).unlink(missing_ok=True)  # never counted in the stats
+        raise
+    track_files_added(item_paths)
+
+async def run_batch(batch_id: str, plan: dict, pending: list, source_paths: List[str], source_names: List[str]):
+    """Prepare shared inputs, then hand each render its reserved queue slot
+    
+    Items are handled in order; on cancellation every item not yet handled
+    (including one whose sources are being staged) is abandoned.
+    """
+    handled = 0
+    item_paths = []
+    staging = None
+    try:
+        prepare = {}
+        try:
+            if any(plan.values()):
+                loop = asyncio.get_running_loop()
+                prepare = await loop.run_in_executor(get_render_pool(), prepare_batch_assets, plan)
+                print(f"🧰 Batch {batch_id} prepared: {prepare}")
+        except Exception as e:
+            print(f"⚠️ Batch preparation failed, rendering without it: {e}")
+            prepare = {"error": str(e)}
+        await asyncio.to_thread(write_job, batch_id, status="rendering", prepare_seconds=prepare,
+                                prepared_at=time.time())
+        
+        for job_id, fingerprint, indices, options in pending:
+            # Every render consumes its own staged copies of the sources
+            item_paths = [str(UPLOAD_DIR / f"src_{uuid.uuid4()}{Path(source_paths[i]).suffix}") for i in indices]
+            staging = asyncio.ensure_future(asyncio.to_thread(stage_batch_item, source_paths, indices, item_paths))
+            released = False
+            try:
+                await asyncio.shield(staging)
+                release_renders(1)  # the render takes over this item's slot
+                released = True
+                submit_render_job(job_id, item_paths, [source_names[i] for i in indices], options)
+            except Exception as e:
+                if not released:
+                    release_renders(1)
+                handled += 1
+                failed_paths, item_paths = item_paths, []
+                await asyncio.to_thread(abandon_render_job, fingerprint, job_id, e, failed_paths)
+                continue
+            handled += 1
+            item_paths = []
+    finally:
+        if staging is not None and item_paths:
+            # Let a cancelled copy finish before its files are removed
+            await asyncio.wait([staging])
+        release_renders(len(pending) - handled)
+        for n, (job_id, fingerprint, _, _) in enumerate(pending[handled:]):
+            await asyncio.to_thread(abandon_render_job, fingerprint, job_id, "Batch cancelled",
+                                    item_paths if n == 0 else [])
+        await asyncio.to_thread(remove_tracked_files, source_paths)
+        _batch_tasks.pop(batch_id, None)
+
+def batch_report(batch_id: str) -> dict:
+    """Per-item status/results plus aggregate timing for a batch"""
+    batch = read_job(batch_id)
+    if not batch or batch.get("kind") != "batch":
+        raise HTTPException(404, f"Batch not found: {batch_id}")
+    
+    items = []
+    statuses = {}
+    render_seconds = []
+    finished = []
+    for item in batch["items"]:
+        job = read_live_job(item["job_id"]) or {}
+        status = job.get("status", "missing")
+        statuses[status] = statuses.get(status, 0) + 1
+        # Shared jobs were rendered (and timed) by whichever item owns them
+        if not item["render_cached"] and job.get("started_at") and job.get("finished_at"):
+            render_seconds.append(job["finished_at"] - job["started_at"])
+            finished.append(job["finished_at"])
+        items.append({
+            **item,
+            "status": status,
+            "error": job.get("error"),
+            "result": job.get("result"),
+            "status_url": f"/api/jobs/{item['job_id']}",
+            "result_url": f"/api/jobs/{item['job_id']}/result"
+        })
+    
+    if batch.get("status") == "preparing":
+        status = "preparing"
+    elif statuses.get("queued") or statuses.get("running"):
+        status = "rendering"
+    else:
+        status = "done" if statuses.get("done") == len(items) else "done_with_errors"
+    complete = status.startswith("done")
+    return {
+        "success": True,
+        "batch_id": batch_id,
+        "status": status,
+        "counts": statuses,
+        "shared": batch.get("shared"),
+        "timing": {
+            "upload_seconds": batch.get("upload_seconds"),
+            "prepare_seconds": batch.get("prepare_seconds"),
+            "render_seconds_total": round(sum(render_seconds), 3),
+            "render_seconds_max": round(max(render_seconds), 3) if render_seconds else None,
+            "wall_seconds": (round(max([batch.get("prepared_at", batch["created_at"]), *finished])
+                                       - batch["created_at"], 3) if complete else None)
+        },
+        "items": items
+    }
+
+@app.post("/api/batch-render")
+async def batch_render(
+    images: List[UploadFile] = File(...),
+    specs: str = Form(...),
+    async_job: bool = Form(False)
+):
+    """Render many videos from one set of uploads in a single planned batch
+    
+    specs is a JSON list of create-video option objects (audio_text, voice,
+    filter, quality, ...); "images" optionally picks upload indices for an
+    item (default: all uploads, in order). Shared image processing, narration
+    and music run once before any render starts, and identical items share
+    one job. With async_job=true the batch id is returned right away; poll
+    /api/batches/{batch_id}.
+    """
+    started = time.time()
+    try:
+        items = json.loads(specs)
+    except json.JSONDecodeError as e:
+        raise HTTPException(400, f"specs must be a JSON list: {e}")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(400, "specs must be a non-empty JSON list")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"At most {BATCH_MAX_ITEMS} items per batch")
+    parsed = [batch_item_options(index, spec, len(images)) for index, spec in enumerate(items)]
+    
+    reserve_renders(len(parsed))
+    reserved = len(parsed)
+    source_paths = []
+    pending = []
+    try:
+        source_paths, source_names, source_hashes = await stage_uploads(images)
+        upload_seconds = round(time.time() - started, 3)
+        batch_id = str(uuid.uuid4())
+        
+        batch_items = []
+        for index, (options, indices) in enumerate(parsed):
+            item_hashes = [source_hashes[i] for i in indices]
+            options = {**options, "num_images": len(indices), "source_hashes": item_hashes}
+            fingerprint = render_fingerprint(item_hashes, options)
+            job_id, owner = await asyncio.to_thread(open_render_job, fingerprint, len(indices), batch_id=batch_id)
+            if owner:
+                # Same as an earlier item (or an earlier render) - share its job
+                batch_items.append({"index": index, "job_id": owner, "render_cached": True})
+                release_renders(1)
+                reserved -= 1
+                continue
+            pending.append((job_id, fingerprint, indices, options))
+            batch_items.append({"index": index, "job_id": job_id, "render_cached": False})
+        
+        plan = plan_batch([(options, indices) for _, _, indices, options in pending],
+                          source_paths, source_names, source_hashes)
+        shared = {
+            "items": len(parsed),
+            "renders": len(pending),
+            "image_derivatives": len(plan["images"]),
+            "narrations": len(plan["narrations"]),
+            "music_tracks": len(plan["music"])
+        }
+        await asyncio.to_thread(write_job, batch_id, kind="batch", status="preparing", created_at=started,
+                                upload_seconds=upload_seconds, items=batch_items, shared=shared)
+    except BaseException as e:
+        release_renders(reserved)
+        for job_id, fingerprint, _, _ in pending:
+            await asyncio.to_thread(abandon_render_job, fingerprint, job_id, e, [])
+        await asyncio.to_thread(remove_tracked_files, source_paths)
+        raise
+    print(f"📦 Batch {batch_id}: {shared}")
+    # From here on run_batch owns the reservations and the staged sources
+    task = asyncio.create_task(run_batch(batch_id, plan, pending, source_paths, source_names))
+    _batch_tasks[batch_id] = task
+    
+    if async_job:
+        return {
+            "success": True,
+            "batch_id": batch_id,
+            "status_url": f"/api/batches/{batch_id}",
+            "shared": shared,
+            "items": [{**item, "status_url": f"/api/jobs/{item['job_id']}"} for item in batch_items]
+        }
+    
+    await asyncio.shield(task)
+    await asyncio.gather(*(wait_for_job(item["job_id"]) for item in batch_items), return_exceptions=True)
+    return await asyncio.to_thread(batch_report, batch_id)
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Status, per-item results and aggregate timing of a batch render"""
+    return await asyncio.to_thread(batch_report, batch_id)
+
+# ==================== STORAGE JANITOR ====================
+# Renders remove their own intermediates; the janitor handles everything that
+# outlives a request. Every file class has a TTL (RETENTION_<CLASS>_HOURS),
+# and when uploads + outputs exceed STORAGE_QUOTA_GB the least recently used
+# finished artifacts are evicted. A video's HLS playlist and segments are
+# treated as one entry. One worker process sweeps at a time.
+JANITOR_INTERVAL_SECONDS = int(os.getenv("JANITOR_INTERVAL_SECONDS", "900"))
+JANITOR_MIN_AGE_SECONDS = 600  # never touch files this fresh; a render may be using them
+STORAGE_QUOTA_BYTES = int(float(os.getenv("STORAGE_QUOTA_GB", "20")) * 1024 ** 3)
+JANITOR_LOCK_FILE = CACHE_DIR / "janitor.lock"
+JANITOR_REPORT_FILE = CACHE_DIR / "janitor.json"
+
+# (class, directory, filename regex, default TTL hours, evictable for quota)
+STORAGE_CLASSES = [
+    ("temp", OUTPUT_DIR, r"temp_", 1, False),
+    ("staged_uploads", UPLOAD_DIR, r"src_", 6, False),
+    ("processed_images", UPLOAD_DIR, r"[0-9a-f-]{36}\.jpg$", 24, True),
+    ("stock_photos", UPLOAD_DIR, r"stock_", 168, True),
+    ("stock_hashes", STOCK_HASH_DIR, r"[0-9a-f]{64}(_720p)?$", 168, False),
+    ("subtitles", OUTPUT_DIR, r"subtitles_", 24, True),
+    ("videos", OUTPUT_DIR, r"video_", 168, True),
+    ("jobs", JOB_DIR, r".*\.json$", 168, False),
+    ("job_owners", JOB_DIR, r"owner_.*\.alive$", 24, False),
+    ("render_index", RENDER_INDEX_DIR, r".*\.json$", 168, False),
+]
+STORAGE_TTLS = {name: float(os.getenv(f"RETENTION_{name.upper()}_HOURS", str(hours))) * 3600
+                for name, _, _, hours, _ in STORAGE_CLASSES}
+_STORAGE_PATTERNS = [(name, directory, re.compile(pattern), evictable)
+                     for name, directory, pattern, _, evictable in STORAGE_CLASSES]
+_VIDEO_GROUP = re.compile(r"(video_[0-9a-f-]{36})")
+
+def scan_storage() -> Dict[Tuple[str, str], dict]:
+    """Group managed files into entries keyed by (class, group name)
+    
+    Leftover dotfile temps from crashed writers count as "temp"; files that
+    match no class are never touched.
+    """
+    entries = {}
+    for directory in {d for _, d, _, _ in _STORAGE_PATTERNS}:
+        try:
+            scanner = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with scanner:
+            for item in scanner:
+                if not item.is_file(follow_symlinks=False):
+                    continue
+                if item.name.startswith("."):
+                    name, evictable, group = "temp", False, item.path
+                else:
+                    match = next(((cls, evictable) for cls, d, pattern, evictable in _STORAGE_PATTERNS
+                                  if d == directory and pattern.match(item.name)), None)
+                    if match is None:
+                        continue
+                    name, evictable = match
+                    video = _VIDEO_GROUP.match(item.name) if name == "videos" else None
+                    group = video.group(1) if video else item.path
+                try:
+                    stat = item.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entry = entries.setdefault((name, group), {
+                    "class": name, "evictable": evictable, "paths": [],
+                    "bytes": 0, "last_used": 0.0, "newest": 0.0
+                })
+                entry["paths"].append(item.path)
+                entry["bytes"] += stat.st_size
+                entry["last_used"] = max(entry["last_used"], stat.st_atime, stat.st_mtime)
+                entry["newest"] = max(entry["newest"], stat.st_mtime)
+    return entries
+
+def storage_usage_bytes() -> int:
+    """Total bytes in the upload and output directories (managed or not)"""
+    total = 0
+    for directory in (UPLOAD_DIR, OUTPUT_DIR, JOB_DIR):
+        with os.scandir(directory) as scanner:
+            for item in scanner:
+                if item.is_file(follow_symlinks=False):
+                    try:
+                        total += item.stat(follow_symlinks=False).st_size
+                    except FileNotFoundError:
+                        pass
+    return total
+
+def sweep_storage(force: bool = False) -> Optional[dict]:
+    """One janitor pass: TTL expiry, then LRU eviction down to the quota
+    
+    Returns the sweep report, or None if another process is sweeping or a
+    sweep ran recently (unless force is set).
+    """
+    with open(JANITOR_LOCK_FILE, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        previous = read_janitor_report()
+        now = time.time()
+        if not force and previous and now - previous.get("finished_at", 0) < JANITOR_INTERVAL_SECONDS / 2:
+            return None
+        
+        entries = scan_storage()
+        reclaimed = {}
+        
+        def remove(entry: dict, reason: str):
+            remove_tracked_files(entry["paths"])
+            stats = reclaimed.setdefault(entry["class"], {"files": 0, "bytes": 0, "expired": 0, "evicted": 0})
+            stats["files"] += len(entry["paths"])
+            stats["bytes"] += entry["bytes"]
+            stats[reason] += 1
+        
+        survivors = []
+        for entry in entries.values():
+            if now - entry["newest"] < JANITOR_MIN_AGE_SECONDS:
+                survivors.append(entry)
+            elif now - entry["last_used"] > STORAGE_TTLS[entry["class"]]:
+                remove(entry, "expired")
+            else:
+                survivors.append(entry)
+        
+        usage = storage_usage_bytes()
+        if usage > STORAGE_QUOTA_BYTES:
+            candidates = sorted((e for e in survivors if e["evictable"]
+                                 and now - e["newest"] >= JANITOR_MIN_AGE_SECONDS),
+                                key=lambda e: e["last_used"])
+            for entry in candidates:
+                if usage <= STORAGE_QUOTA_BYTES:
+                    break
+                remove(entry, "evicted")
+                usage -= entry["bytes"]
+        
+        files = sum(stats["files"] for stats in reclaimed.values())
+        reclaimed_bytes = sum(stats["bytes"] for stats in reclaimed.values())
+        report = {
+            "started_at": now,
+            "finished_at": time.time(),
+            "files_removed": files,
+            "bytes_reclaimed": reclaimed_bytes,
+            "usage_bytes": usage,
+            "quota_bytes": STORAGE_QUOTA_BYTES,
+            "by_class": reclaimed
+        }
+        tmp_path = JANITOR_REPORT_FILE.with_name(f".{JANITOR_REPORT_FILE.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+        os.replace(tmp_path, JANITOR_REPORT_FILE)
+        if files:
+            increment_counter("janitor_files_removed", files)
+            increment_counter("janitor_bytes_reclaimed", reclaimed_bytes)
+        return report
+
+def read_janitor_report() -> Optional[dict]:
+    try:
+        with open(JANITOR_REPORT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+async def janitor_loop():
+    while True:
+        try:
+            report = await asyncio.to_thread(sweep_storage)
+            if report and report["files_removed"]:
+                print(f"🧹 Storage sweep removed {report['files_removed']} files "
+                      f"({report['bytes_reclaimed'] / (1024*1024):.1f} MB reclaimed)")
+        except Exception as e:
+            print(f"⚠️ Storage sweep failed: {e}")
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+
+_janitor_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_storage_janitor():
+    global _janitor_task
+    if JANITOR_INTERVAL_SECONDS > 0:
+        _janitor_task = asyncio.create_task(janitor_loop())
+
+@app.on_event("shutdown")
+async def stop_storage_janitor():
+    if _janitor_task is not None:
+        _janitor_task.cancel()
+
+@app.get("/api/storage")
+async def get_storage_status():
+    """Storage usage per file class, the last sweep and lifetime reclaim totals"""
+    entries = await asyncio.to_thread(scan_storage)
+    classes = {name: {"files": 0, "bytes": 0, "ttl_hours": STORAGE_TTLS[name] / 3600}
+               for name in STORAGE_TTLS}
+    for entry in entries.values():
+        classes[entry["class"]]["files"] += len(entry["paths"])
+        classes[entry["class"]]["bytes"] += entry["bytes"]
+    counters = read_counters()
+    return {
+        "success": True,
+        "usage_bytes": await asyncio.to_thread(storage_usage_bytes),
+        "quota_bytes": STORAGE_QUOTA_BYTES,
+        "classes": classes,
+        "last_sweep": read_janitor_report(),
+        "total_files_removed": counters.get("janitor_files_removed", 0),
+        "total_bytes_reclaimed": counters.get("janitor_bytes_reclaimed", 0)
+    }
+
+@app.post("/api/storage/sweep")
+async def run_storage_sweep():
+    """Run a janitor pass now"""
+    report = await asyncio.to_thread(sweep_storage, True)
+    if report is None:
+        raise HTTPException(409, "A storage sweep is already running")
+    return {"success": True, **report}
+
+# ==================== FILE DELIVERY ====================
+# Downloads honour conditional GETs (ETag / Last-Modified -> 304) and single
+# byte ranges (206), which browsers use to start and seek mp4 playback. With
+# DOWNLOAD_OFFLOAD=x-accel-redirect (nginx) or x-sendfile (Apache/lighttpd)
+# the body is handed to the front proxy after validation.
+DOWNLOAD_OFFLOAD = os.getenv("DOWNLOAD_OFFLOAD", "").lower()
+DOWNLOAD_ACCEL_PREFIX = os.getenv("DOWNLOAD_ACCEL_PREFIX", "/protected").rstrip("/")
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+# Rendered outputs get fresh uuid names and are never rewritten, except HLS
+# playlists, which grow while their render is running
+OUTPUT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PLAYLIST_CACHE_CONTROL = "no-cache"
+UPLOAD_CACHE_CONTROL = "public, max-age=86400"
+
+def locate_download(filename: str) -> Tuple[Path, os.stat_result, str]:
+    """Find a servable file in OUTPUT_DIR, then UPLOAD_DIR, with one stat per candidate"""
+    if not filename or filename.startswith(".") or "/" in filename or "\\" in filename:
+        raise HTTPException(404, f"File not found: {filename}")
+    for directory, cache_control in ((OUTPUT_DIR, OUTPUT_CACHE_CONTROL), (UPLOAD_DIR, UPLOAD_CACHE_CONTROL)):
+        file_path = directory / filename
+        try:
+            stat = file_path.stat()
+        except OSError:
+            continue
+        if stat.st_mode & 0o170000 == 0o100000:  # regular file
+            if filename.endswith(".m3u8"):
+                cache_control = PLAYLIST_CACHE_CONTROL
+            return file_path, stat, cache_control
+    raise HTTPException(404, f"File not found: {filename}")
+
+def file_etag(stat: os.stat_result) -> str:
+    # Files are written atomically and never modified in place, so size +
+    # mtime identifies the bytes
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=" range into inclusive (start, end)
+    
+    Returns None for headers that should be ignored (multiple ranges, other
+    units, malformed, last byte before first) and raises 416 for
+    unsatisfiable ranges (first byte at or past the end).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not all(part.isdigit() for part in (first, last) if part) or not (first or last):
+        return None
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None  # last-pos before first-pos is invalid, not unsatisfiable
+    else:
+        start = max(0, size - int(last))
+        end = size - 1
+    if start >= size:
+        raise HTTPException(416, "Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+async def read_file_range(file_path: Path, start: int, length: int):
+    async with aiofiles.open(file_path, 'rb') as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(DOWNLOAD_CHUNK_BYTES, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
 @app.get("/api/download/{filename}")
-async def download_file(filename: str):
-    """Download endpoint for generated files and stock photos"""
-    # Try output directory first (for generated content)
-    file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
-        # Try upload directory (for uploaded/stock images)
-        file_path = UPLOAD_DIR / filename
+async def download_file(filename: str, request: Request):
+    """Download endpoint for generated files and stock photos
     
-    if not file_path.exists():
+    Supports conditional GET (304), single byte ranges (206) and optional
+    X-Accel-Redirect / X-Sendfile offload.
+    """
+    try:
+        file_path, stat, cache_control = locate_download(filename)
+    except HTTPException:
         print(f"❌ File not found: {filename}")
-        raise HTTPException(404, f"File not found: {filename}")
+        raise
+    
+    etag = file_etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes"
+    }
+    if not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+    
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    quoted = urllib.parse.quote(filename)
+    headers["Content-Disposition"] = (f'attachment; filename="{filename}"' if quoted == filename
+                                      else f"attachment; filename*=utf-8''{quoted}")
+    
+    if DOWNLOAD_OFFLOAD == "x-accel-redirect":
+        # nginx serves the bytes (including ranges) from an internal location
+        directory = "outputs" if file_path.parent == OUTPUT_DIR else "uploads"
+        headers["X-Accel-Redirect"] = f"{DOWNLOAD_ACCEL_PREFIX}/{directory}/{filename}"
+        return Response(media_type=media_type, headers=headers)
+    if DOWNLOAD_OFFLOAD == "x-sendfile":
+        headers["X-Sendfile"] = str(file_path)
+        return Response(media_type=media_type, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = parse_byte_range(range_header, stat.st_size)
+    
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(read_file_range(file_path, start, length), status_code=206,
+                                 media_type=media_type, headers=headers)
     
-    print(f"📤 Serving file: {filename} ({file_path.stat().st_size / 1024:.2f} KB)")
-    return FileResponse(path=file_path, filename=filename)
+    print(f"📤 Serving file: {filename} ({stat.st_size / 1024:.2f} KB)")
+    return FileResponse(path=file_path, filename=filename, media_type=media_type,
+                        headers=headers, stat_result=stat)
 
 @app.get("/api/stats")
 async def get_stats():
-    """Get system statistics with enhanced visuals"""
+    """Get system statistics with enhanced visuals
+    
+    File counts and sizes come from the incrementally maintained storage
+    stats, so this never walks the shared volume after the first call.
+    """
     try:
-        upload_count = len(list(UPLOAD_DIR.glob("*")))
-        output_count = len(list(OUTPUT_DIR.glob("*")))
-        music_count = sum(len(list((MUSIC_DIR / cat).glob("*"))) for cat in ["upbeat", "calm", "corporate", "cinematic", "inspirational"])
+        storage = read_storage_stats()
+        if "reconciled_at" not in storage:
+            storage = await asyncio.to_thread(reconcile_storage_stats, True) or read_storage_stats()
+        areas = storage.get("areas", {})
+        now = time.time()
+        
+        def area_stats(area: str) -> dict:
+            entry = areas.get(area, {})
+            oldest = entry.get("oldest_mtime")
+            return {
+                "count": entry.get("files", 0),
+                "bytes": entry.get("bytes", 0),
+                "oldest_age_seconds": round(now - oldest) if oldest else None
+            }
         
         return {
             "success": True,
             "stats": {
-                "uploads": {"count": upload_count, "emoji": "📤", "color": "#3b82f6"},
-                "outputs": {"count": output_count, "emoji": "🎬", "color": "#10b981"},
-                "music_tracks": {"count": music_count, "emoji": "🎵", "color": "#8b5cf6"},
+                "uploads": {**area_stats("uploads"), "emoji": "📤", "color": "#3b82f6"},
+                "outputs": {**area_stats("outputs"), "emoji": "🎬", "color": "#10b981"},
+                "music_tracks": {**area_stats("music"), "emoji": "🎵", "color": "#8b5cf6"},
                 "total_voices": {"count": len(VOICE_CONFIG), "emoji": "🎤", "color": "#ec4899"},
                 "filters": {"count": len([f for f in FilterType]), "emoji": "🎨", "color": "#f59e0b"},
                 "transitions": {"count": len([t for t in TransitionType]), "emoji": "🎭", "color": "#6366f1"}
             },
+            "reconciled_at": storage.get("reconciled_at"),
             "features": {
                 "stock_photos": "✅" if PEXELS_API_KEY else "❌",
                 "tts": "✅",
@@ -1039,6 +4279,84 @@ async def get_stats():
         print(f"Error getting stats: {e}")
         return {"success": False, "error": str(e)}
 
+METRIC_HELP = {
+    "render_stage_seconds": "Wall time of each render pipeline stage",
+    "image_decode_seconds": "Decode time of one source image",
+    "image_filter_seconds": "Color filter time of one image",
+    "audio_probe_seconds": "ffprobe duration lookups (formats not read in-process)",
+    "upstream_request_seconds": "Latency of requests to external services",
+}
+
+def render_metrics() -> str:
+    """Prometheus text exposition of the shared metrics and counters"""
+    metrics = read_locked_json(METRICS_FILE)
+    counters = read_counters()
+    lines = []
+    
+    for name, series in sorted(metrics.get("histograms", {}).items()):
+        metric = f"{METRIC_PREFIX}_{name}"
+        lines += [f"# HELP {metric} {METRIC_HELP.get(name, name)}", f"# TYPE {metric} histogram"]
+        for key, data in sorted(series.items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, count in zip([*METRIC_BUCKETS, "+Inf"], data["buckets"]):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_metric_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{metric}_sum{_metric_labels(labels)} {data['sum']:.6f}")
+            lines.append(f"{metric}_count{_metric_labels(labels)} {data['count']}")
+    
+    gauges = metrics.get("gauges", {})
+    for name, help_text in (("render_queue_depth", "Renders queued or running, across API workers"),
+                            ("ffmpeg_processes", "ffmpeg processes currently running")):
+        now = time.time()
+        value = sum(entry["value"] for owner, entry in gauges.get(name, {}).items()
+                    if _gauge_entry_live(owner, entry, now))
+        lines += [f"# HELP {METRIC_PREFIX}_{name} {help_text}", f"# TYPE {METRIC_PREFIX}_{name} gauge",
+                  f"{METRIC_PREFIX}_{name} {value}"]
+    
+    # <cache>_hits / _misses / _evictions counters become labelled cache series
+    caches = {}
+    plain = {}
+    for name, value in counters.items():
+        cache, _, kind = name.rpartition("_")
+        if kind in ("hits", "misses", "evictions") and cache.endswith("_cache"):
+            caches.setdefault(cache[:-len("_cache")], {})[kind] = value
+        else:
+            plain[name] = value
+    for metric, help_text, kinds in (
+        ("cache_requests_total", "Cache lookups by result", {"hits": "hit", "misses": "miss"}),
+        ("cache_evictions_total", "Entries evicted to stay under the size limit", {"evictions": None}),
+    ):
+        lines += [f"# HELP {METRIC_PREFIX}_{metric} {help_text}", f"# TYPE {METRIC_PREFIX}_{metric} counter"]
+        for cache, values in sorted(caches.items()):
+            for kind, result in kinds.items():
+                labels = {"cache": cache, **({"result": result} if result else {})}
+                lines.append(f"{METRIC_PREFIX}_{metric}{_metric_labels(labels)} {values.get(kind, 0)}")
+    lines += [f"# HELP {METRIC_PREFIX}_cache_hit_ratio Hits over lookups since the counters started",
+              f"# TYPE {METRIC_PREFIX}_cache_hit_ratio gauge"]
+    for cache, values in sorted(caches.items()):
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        ratio = values.get("hits", 0) / lookups if lookups else 0.0
+        lines.append(f"{METRIC_PREFIX}_cache_hit_ratio{_metric_labels({'cache': cache})} {ratio:.4f}")
+    for name, value in sorted(plain.items()):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    
+    areas = read_storage_stats().get("areas", {})
+    lines += [f"# HELP {METRIC_PREFIX}_storage_bytes Bytes stored per area",
+              f"# TYPE {METRIC_PREFIX}_storage_bytes gauge"]
+    lines += [f"{METRIC_PREFIX}_storage_bytes{_metric_labels({'area': area})} {entry.get('bytes', 0)}"
+              for area, entry in sorted(areas.items())]
+    return "\n".join(lines) + "\n"
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    def collect() -> str:
+        flush_metrics()
+        return render_metrics()
+    return PlainTextResponse(await asyncio.to_thread(collect), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     print("="*60)